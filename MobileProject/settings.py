@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'drf_yasg',
 
     # custom apps
@@ -187,6 +188,16 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Keyset pagination of product listings (main.pagination.KeysetPagination)
+PRODUCT_PAGE_SIZE = int(os.environ.get('PRODUCT_PAGE_SIZE', 20))
+PRODUCT_MAX_PAGE_SIZE = int(os.environ.get('PRODUCT_MAX_PAGE_SIZE', 100))
+
+# 'postgresql' (tsvector + trigram) or 'inverted_index'; defaults to the database vendor
+PRODUCT_SEARCH_BACKEND = os.environ.get('PRODUCT_SEARCH_BACKEND')
+
+# Lower edges of the price buckets returned by the facets mode of main/filter
+PRODUCT_PRICE_FACETS = (0, 10, 20, 50, 100, 200)
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -206,6 +217,13 @@ STATIC_URL = 'chat/static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Bulk product import (main.importers): rows per bulk_create, upload and report directory
+PRODUCT_IMPORT_BATCH_SIZE = int(os.environ.get('PRODUCT_IMPORT_BATCH_SIZE', 1000))
+PRODUCT_IMPORT_DIR = os.path.join(MEDIA_ROOT, 'imports')
+
+# Products per server-side cursor fetch of the NDJSON export (main.exporters)
+PRODUCT_EXPORT_CHUNK_SIZE = int(os.environ.get('PRODUCT_EXPORT_CHUNK_SIZE', 2000))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -221,6 +239,57 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 
 celery_host = os.environ.get('CELERY_HOST')
 
+# Redis for the hot data structures (leaderboards, ...); features fall back to
+# the database when it is not configured.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# The cache holds the version counters behind ETags and cache invalidation,
+# which web and Celery processes must share: without REDIS_URL it uses the
+# Redis already running for Celery, and is only process-local when neither
+# is configured (local development).
+CACHE_URL = REDIS_URL or (f'redis://{celery_host}/1' if celery_host else None)
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Two-tier cache of categories, colors and sizes (main.cache.TwoTierCache)
+REFERENCE_CACHE_TIMEOUT = int(os.environ.get('REFERENCE_CACHE_TIMEOUT', 60 * 60))
+REFERENCE_CACHE_LOCAL_TTL = int(os.environ.get('REFERENCE_CACHE_LOCAL_TTL', 5))
+REFERENCE_CACHE_LOCAL_MAX_ENTRIES = 1024
+
+# Lifetime of a user's cart hash in Redis (main.carts.CartStore), refreshed on load
+CART_CACHE_TIMEOUT = int(os.environ.get('CART_CACHE_TIMEOUT', 60 * 60 * 24 * 7))
+
+# Aggregated product page (main.product_detail), dropped on every write to the product
+PRODUCT_DETAIL_CACHE_TIMEOUT = int(os.environ.get('PRODUCT_DETAIL_CACHE_TIMEOUT', 60 * 10))
+
+# Promo code metadata read by validation (main.promos); redemption always hits the database
+PROMO_CODE_CACHE_TIMEOUT = int(os.environ.get('PROMO_CODE_CACHE_TIMEOUT', 30))
+
+# Orders moved per transaction by main.orders.transition_orders
+ORDER_TRANSITION_BATCH_SIZE = int(os.environ.get('ORDER_TRANSITION_BATCH_SIZE', 1000))
+
+# Cart stock holds (main.reservations): lifetime of a hold and holds released per sweep script call
+STOCK_HOLD_TIMEOUT = int(os.environ.get('STOCK_HOLD_TIMEOUT', 60 * 15))
+STOCK_HOLD_SWEEP_BATCH_SIZE = 500
+
+# Active-discount index (customer.discounts); never kept past the next discount start or end
+ACTIVE_DISCOUNTS_CACHE_TIMEOUT = int(os.environ.get('ACTIVE_DISCOUNTS_CACHE_TIMEOUT', 60 * 60))
+
 CELERY_RESULT_BACKEND = f'redis://{celery_host}/0'
 CELERY_BROKER_URL = f'redis://{celery_host}/0'
 CELERY_TIMEZONE = TIME_ZONE
@@ -230,4 +299,21 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'main.tasks.clear_temporary_files',
         'schedule': crontab(hour=12),
     },
+    'rebuild-leaderboards-daily': {
+        'task': 'main.tasks.rebuild_leaderboards',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'reconcile-category-counts-hourly': {
+        'task': 'main.tasks.reconcile_category_counts',
+        'schedule': crontab(minute=15),
+    },
+    # Re-arms the boundary refreshes should a scheduled one be lost
+    'refresh-active-discounts': {
+        'task': 'main.tasks.refresh_active_discounts',
+        'schedule': crontab(minute='*/10'),
+    },
+    'release-expired-stock-holds': {
+        'task': 'main.tasks.release_expired_stock_holds',
+        'schedule': crontab(),
+    },
 }
@@ -0,0 +1,144 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from customer.models import DiscountProduct, DiscountCategory
+from customer.serializers import DiscountProductListSerializer, DiscountCategoryListserializer
+from main.cache import get_version, bump_version
+from main.pricing import discounted_prices
+
+ACTIVE_DISCOUNTS_KEY_PREFIX = 'active-discounts:'
+
+# Next boundary of the last index built, kept without expiry: the index
+# itself expires at that boundary, so this is how a rebuild learns that a
+# window closed since and the version has to move on
+WINDOW_END_KEY = f'{ACTIVE_DISCOUNTS_KEY_PREFIX}window-end'
+
+
+def active_at(now):
+    """Discounts run from ``start_time`` up to, not including, ``end_time``."""
+    return Q(start_time__lte=now, end_time__gt=now)
+
+
+def effective_price(price, percentage):
+    return float(discounted_prices(price, percentage))
+
+
+def next_boundary(now):
+    """The first start or end of a discount after ``now``, or ``None``; one query per table."""
+    boundaries = []
+    for model in (DiscountProduct, DiscountCategory):
+        boundaries += model.objects.aggregate(
+            next_start=Min('start_time', filter=Q(start_time__gt=now)),
+            next_end=Min('end_time', filter=Q(end_time__gt=now)),
+        ).values()
+    return min((boundary for boundary in boundaries if boundary is not None), default=None)
+
+
+def build_active_discount_index(now):
+    """
+    The discounts running at ``now``, valid until ``next_boundary``:
+    the serialized discount rows, each product discount with the
+    ``effective_price`` of its product under the best of its own and its
+    category's discounts, and ``{id: percentage}`` maps of the best
+    discount per product and per category.
+    """
+    product_discounts = list(
+        DiscountProduct.objects.filter(active_at(now)).select_related('product').order_by('id')
+    )
+    category_discounts = list(DiscountCategory.objects.filter(active_at(now)).order_by('id'))
+
+    category_percentages = {}
+    for discount in category_discounts:
+        category_percentages[discount.category_id] = max(
+            category_percentages.get(discount.category_id, 0), discount.discount_percentage
+        )
+    product_percentages = {}
+    for discount in product_discounts:
+        product_percentages[discount.product_id] = max(
+            product_percentages.get(discount.product_id, 0), discount.discount_percentage
+        )
+
+    products = []
+    for discount, data in zip(product_discounts, DiscountProductListSerializer(product_discounts, many=True).data):
+        percentage = max(product_percentages[discount.product_id],
+                         category_percentages.get(discount.product.category_id, 0))
+        products.append({**data, 'effective_price': effective_price(discount.product.price, percentage)})
+
+    boundary = next_boundary(now)
+    return {
+        'next_boundary': boundary,
+        'products': products,
+        'categories': [dict(data) for data in DiscountCategoryListserializer(category_discounts, many=True).data],
+        'product_percentages': product_percentages,
+        'category_percentages': category_percentages,
+    }
+
+
+def store_active_discount_index(now):
+    """Build the index for ``now`` and cache it until its next boundary at the latest."""
+    version = get_version('discount')
+    index = build_active_discount_index(now)
+    boundary = index['next_boundary']
+    index['etag'] = f'discount.{version}'
+
+    timeout = settings.ACTIVE_DISCOUNTS_CACHE_TIMEOUT
+    if boundary is not None:
+        timeout = min(timeout, max(math.ceil((boundary - now).total_seconds()), 1))
+    cache.set(f'{ACTIVE_DISCOUNTS_KEY_PREFIX}{version}', index, timeout=timeout)
+    cache.set(WINDOW_END_KEY, boundary, timeout=None)
+    return index
+
+
+def get_active_discounts():
+    """
+    The active-discount index from the cache. It is keyed by the discount
+    version, which is bumped on every discount write and whenever a
+    discount starts or ends, so the version alone tells whether discounted
+    prices changed (``catalog_etag`` relies on this). The refresh task
+    normally bumps it and rebuilds the index right at each boundary; a
+    reader finding the window closed first does the same.
+
+    Whether a window closed is told by ``WINDOW_END_KEY``, not by the index
+    entry, which expires at the boundary and may be gone by then.
+    """
+    now = timezone.now()
+    version = get_version('discount')
+    index = cache.get(f'{ACTIVE_DISCOUNTS_KEY_PREFIX}{version}')
+    if index is not None and (index['next_boundary'] is None or index['next_boundary'] > now):
+        return index
+
+    window_end = cache.get(WINDOW_END_KEY)
+    if window_end is not None and window_end <= now:
+        # Only one reader moves the version on per closed window
+        if cache.add(f'{ACTIVE_DISCOUNTS_KEY_PREFIX}closed:{version}', 1, timeout=60):
+            bump_version('discount')
+    return store_active_discount_index(now)
+
+
+def refresh_active_discounts():
+    """
+    Make sure the index is current, moving to a new version when a
+    window has closed, and return its next boundary, at which the caller
+    schedules the next refresh.
+    """
+    return get_active_discounts()['next_boundary']
+
+
+def claim_refresh(boundary):
+    """``True`` for the first caller scheduling a refresh at ``boundary``, so each is queued once."""
+    timeout = max(math.ceil((boundary - timezone.now()).total_seconds()), 0) + 60
+    return cache.add(f'{ACTIVE_DISCOUNTS_KEY_PREFIX}refresh:{int(boundary.timestamp())}', 1, timeout=timeout)
+
+
+def active_discounts_etag(request, *args, **kwargs):
+    return get_active_discounts()['etag']
+
+
+# Answers If-None-Match with 304 from the cached index alone
+conditional_active_discounts = method_decorator(condition(etag_func=active_discounts_etag), name='get')
@@ -0,0 +1,127 @@
+import bisect
+import threading
+
+from customer.models import Country, State, City
+from main.cache import get_version
+
+
+class GeoLookupError(Exception):
+    pass
+
+
+class CountryNotFoundError(GeoLookupError):
+    def __init__(self):
+        super().__init__('such a country does not exist !!!')
+
+
+class StateNotFoundError(GeoLookupError):
+    def __init__(self):
+        super().__init__('There is no state in such a country !!!')
+
+
+class CityNotFoundError(GeoLookupError):
+    def __init__(self):
+        super().__init__('There is no city in such a state !!!')
+
+
+def fold(name):
+    return name.casefold()
+
+
+class GeoIndex:
+    """
+    The whole Country -> State -> City hierarchy in memory, loaded with one
+    query per table: exact name lookups for validating addresses and sorted
+    ``(folded name, id)`` lists of states and cities for prefix searches.
+
+    Every process keeps one index stamped with the ``'geo'`` version, which
+    the Country, State and City receivers bump after each committed write,
+    so reads cost one cache round trip and no query until the data changes.
+    """
+    _current = None
+    _lock = threading.Lock()
+
+    def __init__(self, version, countries, states, cities):
+        self.version = version
+        self.countries = dict(countries)
+        self.states = {state_id: (name, country_id) for state_id, name, country_id in states}
+        self.cities = {city_id: (name, state_id) for city_id, name, state_id in cities}
+
+        # Rows come in id order, so a duplicated name resolves to its first row like ``.first()``
+        self.country_ids, self.state_ids, self.city_ids = {}, {}, {}
+        for country_id, name in countries:
+            self.country_ids.setdefault(name, country_id)
+        for state_id, name, country_id in states:
+            self.state_ids.setdefault((country_id, name), state_id)
+        for city_id, name, state_id in cities:
+            self.city_ids.setdefault((state_id, name), city_id)
+
+        self.prefixes = {
+            'state': sorted((fold(name), state_id) for state_id, (name, _) in self.states.items()),
+            'city': sorted((fold(name), city_id) for city_id, (name, _) in self.cities.items()),
+        }
+
+    @classmethod
+    def load(cls, version):
+        return cls(
+            version,
+            list(Country.objects.order_by('id').values_list('id', 'name')),
+            list(State.objects.order_by('id').values_list('id', 'state', 'country_id')),
+            list(City.objects.order_by('id').values_list('id', 'city', 'state_id')),
+        )
+
+    @classmethod
+    def for_version(cls, version):
+        with cls._lock:
+            if cls._current is None or cls._current.version != version:
+                cls._current = cls.load(version)
+            return cls._current
+
+    def resolve(self, country, state, city):
+        """``(country_id, state_id, city_id)`` of an address given by names, matched exactly."""
+        country_id = self.country_ids.get(country)
+        if country_id is None:
+            raise CountryNotFoundError()
+        state_id = self.state_ids.get((country_id, state))
+        if state_id is None:
+            raise StateNotFoundError()
+        city_id = self.city_ids.get((state_id, city))
+        if city_id is None:
+            raise CityNotFoundError()
+        return country_id, state_id, city_id
+
+    def state_row(self, state_id):
+        name, country_id = self.states[state_id]
+        return {'kind': 'state', 'id': state_id, 'name': name,
+                'country_id': country_id, 'country': self.countries.get(country_id)}
+
+    def city_row(self, city_id):
+        name, state_id = self.cities[city_id]
+        state = self.state_row(state_id)
+        return {'kind': 'city', 'id': city_id, 'name': name, 'state_id': state_id, 'state': state['name'],
+                'country_id': state['country_id'], 'country': state['country']}
+
+    def complete(self, kind, prefix, country_id=None, state_id=None, limit=10):
+        """
+        Up to ``limit`` states or cities whose name starts with ``prefix``,
+        ignoring case, in name order and optionally within one country or
+        state.
+        """
+        entries = self.prefixes[kind]
+        prefix = fold(prefix)
+        row = self.state_row if kind == 'state' else self.city_row
+        results = []
+        for name, entry_id in entries[bisect.bisect_left(entries, (prefix,)):]:
+            if len(results) >= limit or not name.startswith(prefix):
+                break
+            entry = row(entry_id)
+            if country_id is not None and entry['country_id'] != country_id:
+                continue
+            if state_id is not None and entry.get('state_id', entry_id) != state_id:
+                continue
+            results.append(entry)
+        return results
+
+
+def get_geo_index():
+    return GeoIndex.for_version(get_version('geo'))
@@ -16,6 +16,24 @@ class ShippingAddressSerializer(serializers.Serializer):
     country = serializers.CharField()
 
 
+class GeoTypeaheadQuerySerializer(serializers.Serializer):
+    query = serializers.CharField(max_length=25)
+    kind = serializers.ChoiceField(choices=('city', 'state'), default='city')
+    country_id = serializers.IntegerField(required=False)
+    state_id = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class GeoSuggestionSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    state_id = serializers.IntegerField(required=False)
+    state = serializers.CharField(required=False)
+    country_id = serializers.IntegerField()
+    country = serializers.CharField()
+
+
 class DiscountCategorySerializer(serializers.Serializer):
     discount_percentage = serializers.FloatField()
     start_time = serializers.DateTimeField()
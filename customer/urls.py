@@ -6,6 +6,7 @@ from customer.views import (
     DiscountProductListAPIView,
     DiscountCategoryListAPIView,
     ShippingAddressUpdateAPIView,
+    GeoTypeaheadAPIView,
 )
 
 urlpatterns = [
@@ -13,6 +14,7 @@ urlpatterns = [
     path('shipping_address/', ShippingAddressAPIView.as_view(), name='shipping-address'),
     path('shipping_address_update/<int:shipping_address_id>/', ShippingAddressUpdateAPIView.as_view(),
          name='shipping-address-update'),
+    path('geo/typeahead/', GeoTypeaheadAPIView.as_view(), name='geo-typeahead'),
     path('discount_category_list/', DiscountCategoryListAPIView.as_view(), name='discount-product'),
     path('discount_product_list/', DiscountProductListAPIView.as_view(), name='discount-category-list')
 ]
@@ -1,5 +1,9 @@
 from django.core.exceptions import ObjectDoesNotExist
-from django.utils.timezone import now
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from drf_yasg.utils import swagger_auto_schema
+from kombu.exceptions import OperationalError
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -12,12 +16,18 @@ from customer.models import (
 from customer.serializers import (
     ShippingAddressSerializer,
     FavouriteSerializer,
+    GeoTypeaheadQuerySerializer,
+    GeoSuggestionSerializer,
     DiscountProductListSerializer,
     DiscountCategoryListserializer
 )
 
-from main.models import Product
+from customer.discounts import get_active_discounts, conditional_active_discounts
+from customer.geo import get_geo_index, GeoLookupError
+from main.cache import bump_version, conditional_catalog
+from main.models import Product, Category
 from main.serializers import ProductListSerializer
+from main.tasks import refresh_active_discounts
 
 
 class MyFavouriteAPIView(GenericAPIView):
@@ -62,7 +72,7 @@ class MyFavouriteAPIView(GenericAPIView):
         if not favorites:
             return Response('My favourite empty !!!')
         product_ids = [favorite.product_id for favorite in favorites]
-        products = Product.objects.filter(pk__in=product_ids)
+        products = ProductListSerializer.setup_eager_loading(Product.objects.filter(pk__in=product_ids))
         serializer = ProductListSerializer(products, many=True)
         return Response(serializer.data)
 
@@ -90,30 +100,21 @@ class ShippingAddressAPIView(GenericAPIView):
             return Response({'success': False, 'error': 'there is empty data.'})
 
         try:
-            country = Country.objects.get(name=country_name)
-        except Country.DoesNotExist:
-            return Response({'success': False, 'detail': 'such a country does not exist !!!'})
-
-        try:
-            state = State.objects.get(state=state_name, country=country)
-        except State.DoesNotExist:
-            return Response({'success': False, 'detail': 'There is no state in such a country !!!'})
-
-        try:
-            city = City.objects.get(city=city_name, state=state.id)
-            add_data = ShippingAddress.objects.create(
-                user_id=request.user.id,
-                phone_number=phone_number,
-                postal_code=postal_code,
-                street_address=street_address,
-                house_number=house_number,
-                country_id=country.id,
-                state_id=state.id,
-                city_id=city.id
-            )
-            return Response({'success': True, 'detail': 'Added'})
-        except City.DoesNotExist:
-            return Response({'success': False, 'detail': 'There is no city in such a state !!!'})
+            country_id, state_id, city_id = get_geo_index().resolve(country_name, state_name, city_name)
+        except GeoLookupError as e:
+            return Response({'success': False, 'detail': str(e)})
+
+        ShippingAddress.objects.create(
+            user_id=request.user.id,
+            phone_number=phone_number,
+            postal_code=postal_code,
+            street_address=street_address,
+            house_number=house_number,
+            country_id=country_id,
+            state_id=state_id,
+            city_id=city_id
+        )
+        return Response({'success': True, 'detail': 'Added'})
 
     def get(self, request):
         user_id = request.user.id
@@ -122,19 +123,16 @@ class ShippingAddressAPIView(GenericAPIView):
             return Response({'success': False, "error": "user_id is required"})
 
         data = []
-        shipping_addresses = ShippingAddress.objects.filter(user_id=user_id)
+        shipping_addresses = ShippingAddress.objects.filter(user_id=user_id).select_related('country', 'state', 'city')
         for addresses in shipping_addresses:
-            country = Country.objects.get(pk=addresses.country.id)
-            state = State.objects.get(pk=addresses.state.id)
-            city = City.objects.get(pk=addresses.city.id)
             data.append({
                 'phone_number': addresses.phone_number,
                 'postal_code': addresses.postal_code,
                 'street_address': addresses.street_address,
                 'house_number': addresses.house_number,
-                'city': city.city,
-                'state': state.state,
-                'country': country.name
+                'city': addresses.city.city,
+                'state': addresses.state.state,
+                'country': addresses.country.name
             }
             )
         serializer = ShippingAddressSerializer(data, many=True)
@@ -166,35 +164,23 @@ class ShippingAddressUpdateAPIView(GenericAPIView):
             return Response({"error": "ShippingAddress not found"})
 
         try:
-            country = Country.objects.get(name=country_name)
-        except Country.DoesNotExist:
-            return Response({'success': False, 'detail': 'such a country does not exist !!!'})
-
-        try:
-            state = State.objects.get(state=state_name, country=country)
-        except State.DoesNotExist:
-            return Response({'success': False, 'detail': 'There is no state in such a country !!!'})
-
-        try:
-            city = City.objects.get(city=city_name, state=state.id)
-            if phone_number:
-                title.phone_number = phone_number
-            if postal_code:
-                title.postal_code = postal_code
-            if street_address:
-                title.street_address = street_address
-            if house_number:
-                title.house_number = house_number
-            if city:
-                title.city = city
-            if state:
-                title.state = state
-            if country:
-                title.country = country
-            title.save()
-            return Response({'success': True, 'detail': 'Update successfully !'})
-        except City.DoesNotExist:
-            return Response({'success': False, 'detail': 'There is no city in such a state !!!'})
+            country_id, state_id, city_id = get_geo_index().resolve(country_name, state_name, city_name)
+        except GeoLookupError as e:
+            return Response({'success': False, 'detail': str(e)})
+
+        if phone_number:
+            title.phone_number = phone_number
+        if postal_code:
+            title.postal_code = postal_code
+        if street_address:
+            title.street_address = street_address
+        if house_number:
+            title.house_number = house_number
+        title.country_id = country_id
+        title.state_id = state_id
+        title.city_id = city_id
+        title.save()
+        return Response({'success': True, 'detail': 'Update successfully !'})
 
     def delete(self, request, shipping_address_id):
         user = request.user.id
@@ -214,23 +200,92 @@ class ShippingAddressUpdateAPIView(GenericAPIView):
             return Response({'success': False})
 
 
+# Served from the in-process geo index, no query until a country, state or city changes
+@conditional_catalog('geo')
+class GeoTypeaheadAPIView(GenericAPIView):
+    permission_classes = ()
+    serializer_class = GeoSuggestionSerializer
+
+    @swagger_auto_schema(query_serializer=GeoTypeaheadQuerySerializer)
+    def get(self, request):
+        query_serializer = GeoTypeaheadQuerySerializer(data=request.query_params)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=400)
+
+        params = query_serializer.validated_data
+        suggestions = get_geo_index().complete(params['kind'], params['query'], params.get('country_id'),
+                                               params.get('state_id'), params['limit'])
+        return Response(self.serializer_class(suggestions, many=True).data)
+
+
+@receiver(pre_save, sender=DiscountCategory)
+def init_discount_category_count(sender, instance, **kwargs):
+    # Start from the category's counter, the Product receivers keep it current
+    if instance._state.adding:
+        instance.count_product = Category.objects.filter(id=instance.category_id).values_list(
+            'count_product', flat=True
+        ).first() or 0
+
+
+@receiver(post_save, sender=DiscountProduct)
+@receiver(post_delete, sender=DiscountProduct)
+@receiver(post_save, sender=DiscountCategory)
+@receiver(post_delete, sender=DiscountCategory)
+def bump_discount_version(sender, **kwargs):
+    bump_version('discount')
+    # Rebuilds the index and schedules the refresh at its next boundary
+    transaction.on_commit(queue_discount_refresh)
+
+
+def queue_discount_refresh():
+    # Without publish retries, a broker outage does not hold up the request that saved the discount
+    try:
+        refresh_active_discounts.apply_async(retry=False)
+    except OperationalError:
+        # The discount is saved; the beat entry re-arms the refresh schedule within ten minutes
+        pass
+
+
+@receiver(post_save, sender=Product)
+def bump_discounted_prices(sender, instance, created, **kwargs):
+    # The index holds the effective prices of discounted products, which only
+    # follow price and category; a new product has no discount of its own yet
+    # and deleting one deletes its discounts, which bump the version themselves
+    if created:
+        return
+    loaded = (getattr(instance, '_loaded_price', None), getattr(instance, '_loaded_category_id', None))
+    if None in loaded or loaded != (instance.price, instance.category_id):
+        bump_version('discount')
+
+
+# Served from the active-discount index, refreshed at every discount start and end
+@conditional_active_discounts
 class DiscountCategoryListAPIView(GenericAPIView):
     serializer_class = DiscountCategoryListserializer
 
     def get(self, request):
-        discount_category_data = DiscountCategory.objects.filter(start_time__lte=now())
-        serializer = DiscountCategoryListserializer(discount_category_data, many=True)
-        return Response(serializer.data)
+        return Response(get_active_discounts()['categories'])
 
 
+@conditional_active_discounts
 class DiscountProductListAPIView(GenericAPIView):
     serializer_class = DiscountProductListSerializer
 
     def get(self, request):
-        discount_products = DiscountProduct.objects.filter(start_time__lte=now())
+        discount_products = get_active_discounts()['products']
 
-        if not discount_products.exists():
+        if not discount_products:
             return Response({'success': False, 'error': 'No discount products found.'}, status=404)
 
-        serializer = DiscountProductListSerializer(discount_products, many=True)
-        return Response(serializer.data)
+        return Response(discount_products)
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def bump_geo_version(sender, **kwargs):
+    # After commit, so no process stamps an index of uncommitted rows with the new version
+    transaction.on_commit(lambda: bump_version('geo'))
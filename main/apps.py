@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # The signal receivers live in views.py; connect them in every
+        # process (Celery workers, management commands), not only after the
+        # URLconf has been loaded.
+        from . import views  # noqa: F401
@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+VERSION_KEY_PREFIX = 'cache-version:'
+
+# First product of every category, served by ProductListByOtherCategoryAPIView
+PRODUCTS_BY_CATEGORY_CACHE_KEY = 'main:products-by-all-categories'
+
+
+def initial_version():
+    """
+    Starting value of a missing counter: the clock in microseconds, so a
+    counter lost to a flush or restart starts past every value it held and
+    ETags handed out before never match again.
+    """
+    return time.time_ns() // 1000
+
+
+def get_version(namespace):
+    """Current version counter of ``namespace``, bumped on every write."""
+    key = VERSION_KEY_PREFIX + namespace
+    version = cache.get(key)
+    if version is None:
+        version = initial_version()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def get_versions(namespaces):
+    keys = [VERSION_KEY_PREFIX + namespace for namespace in namespaces]
+    versions = cache.get_many(keys)
+    return [versions.get(key) or get_version(namespace) for key, namespace in zip(keys, namespaces)]
+
+
+def bump_version(namespace):
+    key = VERSION_KEY_PREFIX + namespace
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial_version(), timeout=None)
+        return cache.incr(key)
+
+
+class LocalLRUCache:
+    """Small thread-safe in-process LRU whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache:
+    """
+    Read-through cache for rarely changing reference data: an in-process LRU
+    in front of the shared Django cache (Redis in production).
+
+    Shared entries are keyed by the namespace version, so ``invalidate()``
+    drops every entry of the namespace with a single counter bump. Other
+    processes may serve their local copy for at most ``local_ttl`` seconds.
+
+    Concurrent misses are collapsed: threads of one process wait on the
+    lock of the key's stripe, and processes race for a short-lived lock key
+    in the shared cache while the losers wait for the winner's value. The
+    stripes are a fixed pool, since keys come from request input.
+    """
+    lock_timeout = 10
+    lock_wait = 2.0
+    lock_poll_interval = 0.05
+    lock_stripes = 64
+
+    def __init__(self, namespace, timeout=None, local_ttl=None, max_entries=None):
+        self.namespace = namespace
+        self.timeout = timeout or settings.REFERENCE_CACHE_TIMEOUT
+        self.local = LocalLRUCache(
+            max_entries or settings.REFERENCE_CACHE_LOCAL_MAX_ENTRIES,
+            settings.REFERENCE_CACHE_LOCAL_TTL if local_ttl is None else local_ttl,
+        )
+        # Reentrant, so a builder reading another key of the same stripe does not deadlock
+        self._key_locks = [threading.RLock() for _ in range(self.lock_stripes)]
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % self.lock_stripes]
+
+    def get_or_set(self, key, builder):
+        hit, value = self.local.get(key)
+        if hit:
+            return value
+
+        with self._key_lock(key):
+            hit, value = self.local.get(key)
+            if hit:
+                return value
+
+            shared_key = f'{self.namespace}:{get_version(self.namespace)}:{key}'
+            value = cache.get(shared_key)
+            if value is None:
+                value = self._build(shared_key, builder)
+            self.local.set(key, value)
+            return value
+
+    def _build(self, shared_key, builder):
+        lock_key = f'{shared_key}:lock'
+        acquired = cache.add(lock_key, 1, timeout=self.lock_timeout)
+        if not acquired:
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(self.lock_poll_interval)
+                value = cache.get(shared_key)
+                if value is not None:
+                    return value
+
+        try:
+            value = builder()
+            cache.set(shared_key, value, timeout=self.timeout)
+            return value
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+
+    def invalidate(self):
+        bump_version(self.namespace)
+        self.local.clear()
+
+
+def catalog_etag(*namespaces, bucket_seconds=None):
+    """
+    ETag built from the version counters of ``namespaces`` only, so it costs
+    one cache round trip and no query. ``bucket_seconds`` additionally rolls
+    the tag over for responses that depend on the clock (e.g. "new this week").
+    Priced listings requested with a ``promo_code`` also roll over with the
+    promo code version and every ``PROMO_CODE_CACHE_TIMEOUT`` seconds, how
+    stale the promo code cache may be anyway.
+    """
+    def etag_func(request, *args, **kwargs):
+        names = namespaces
+        # Listings priced with a promo code (main.pricing) also follow the
+        # codes, which change with writes and expire or run out in between
+        promo = 'discount' in namespaces and bool(request.GET.get('promo_code'))
+        if promo:
+            names += ('promo-code',)
+        parts = [f'{namespace}.{version}' for namespace, version in zip(names, get_versions(names))]
+        if bucket_seconds:
+            parts.append(f't.{int(time.time() // bucket_seconds)}')
+        if promo:
+            parts.append(f'p.{int(time.time() // settings.PROMO_CODE_CACHE_TIMEOUT)}')
+        return '-'.join(parts)
+    return etag_func
+
+
+def conditional_catalog(*namespaces, bucket_seconds=None):
+    """
+    Class decorator answering ``If-None-Match`` with 304 before the view's
+    ``get`` runs any query or serializer.
+    """
+    return method_decorator(condition(etag_func=catalog_etag(*namespaces, bucket_seconds=bucket_seconds)), name='get')
+
+
+reference_caches = {
+    'category': TwoTierCache('category'),
+    'color': TwoTierCache('color'),
+    'size': TwoTierCache('size'),
+}
@@ -0,0 +1,229 @@
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from redis.exceptions import RedisError
+
+from .models import Product, ShoppingCart
+from .redis_store import get_redis
+from .reservations import StockReservations, UnknownProductsError
+from .serializers import ProductListSerializer
+
+# Marks a cart hash as fully loaded from Postgres, so an empty cart is a hit too
+LOADED_FIELD = '_loaded'
+
+# A load never replaces a hash another request loaded first, nor stores a
+# snapshot read before a write committed: KEYS[2] is the user's generation
+# counter, bumped by every write, and ARGV[2] its value before the read.
+LOAD_IF_CURRENT = """
+if redis.call('exists', KEYS[1]) == 0 and (redis.call('get', KEYS[2]) or '') == ARGV[2] then
+    redis.call('hset', KEYS[1], unpack(ARGV, 3))
+    redis.call('expire', KEYS[1], ARGV[1])
+end
+"""
+
+
+class CartStore:
+    """
+    Shopping carts with Postgres as the durable copy and, when Redis is
+    configured, one Redis hash per user (``product_id -> count``) as the
+    hot copy read by the cart endpoints.
+
+    Every mutation is a single statement against ``ShoppingCart`` relying on
+    the ``(user_id, product_id)`` unique constraint instead of an existence
+    check. Once it commits, one round trip to Redis bumps the user's
+    generation counter and drops the hash, which the next read reloads
+    from Postgres; a read that loaded its rows before the bump does not
+    store them. Any Redis failure drops the hash as well.
+
+    With Redis, the counts in the cart are also held on the products' stock
+    (``main.reservations``); a write the stock cannot cover raises
+    ``OutOfStockError`` and is rolled back.
+    """
+    key_prefix = 'cart:'
+
+    def __init__(self, client):
+        self.client = client
+        self.reservations = StockReservations(client) if client is not None else None
+
+    def key(self, user_id):
+        return f'{self.key_prefix}{user_id}'
+
+    def generation_key(self, user_id):
+        return f'{self.key_prefix}{user_id}:generation'
+
+    def _invalidate(self, user_id):
+        """Drop the user's hash once the write commits, so a rollback never reaches Redis."""
+        if self.client is None:
+            return
+
+        def invalidate():
+            try:
+                pipe = self.client.pipeline()
+                pipe.incr(self.generation_key(user_id))
+                pipe.expire(self.generation_key(user_id), settings.CART_CACHE_TIMEOUT)
+                pipe.delete(self.key(user_id))
+                pipe.execute()
+            except RedisError:
+                self._cache_drop(user_id)
+        transaction.on_commit(invalidate)
+
+    def _cache_drop(self, user_id):
+        try:
+            self.client.delete(self.key(user_id))
+        except RedisError:
+            pass
+
+    def _hold(self, user_id, counts):
+        if self.reservations is not None:
+            self.reservations.hold(user_id, counts)
+
+    def _load(self, user_id):
+        return dict(
+            ShoppingCart.objects.filter(user_id_id=user_id).values_list('product_id_id', 'count_product')
+        )
+
+    def items(self, user_id):
+        """``{product_id: count}`` of the user's cart."""
+        if self.client is None:
+            return self._load(user_id)
+
+        try:
+            pipe = self.client.pipeline()
+            pipe.hgetall(self.key(user_id))
+            pipe.get(self.generation_key(user_id))
+            cached, generation = pipe.execute()
+        except RedisError:
+            return self._load(user_id)
+        if cached:
+            return {int(field): int(count) for field, count in cached.items() if field != LOADED_FIELD.encode()}
+
+        items = self._load(user_id)
+        fields = [LOADED_FIELD, 1]
+        for product_id, count in items.items():
+            fields += [product_id, count]
+        try:
+            self.client.eval(LOAD_IF_CURRENT, 2, self.key(user_id), self.generation_key(user_id),
+                             settings.CART_CACHE_TIMEOUT, generation or b'', *fields)
+        except RedisError:
+            pass
+        return items
+
+    def add(self, user_id, product_id, count):
+        """Add a product, returning ``False`` when it is already in the cart or does not exist."""
+        try:
+            with transaction.atomic():
+                ShoppingCart.objects.create(user_id_id=user_id, product_id_id=product_id, count_product=count)
+                self._hold(user_id, {product_id: count})
+        except (IntegrityError, UnknownProductsError):
+            return False
+        self._invalidate(user_id)
+        return True
+
+    def set_count(self, user_id, product_id, count):
+        """Change the count of a product in the cart, returning ``False`` when it is not there."""
+        with transaction.atomic():
+            updated = ShoppingCart.objects.filter(user_id_id=user_id, product_id_id=product_id).update(
+                count_product=count
+            )
+            if updated:
+                self._hold(user_id, {product_id: count})
+        if updated:
+            self._invalidate(user_id)
+        return bool(updated)
+
+    def remove(self, user_id, product_id):
+        """Remove a product from the cart, returning ``False`` when it was not there."""
+        deleted, _ = ShoppingCart.objects.filter(user_id_id=user_id, product_id_id=product_id).delete()
+        if deleted:
+            if self.reservations is not None:
+                self.reservations.release(user_id, [product_id])
+            self._invalidate(user_id)
+        return bool(deleted)
+
+    def clear(self, user_id, product_ids=None):
+        """Empty the cart, or drop only ``product_ids`` from it."""
+        rows = ShoppingCart.objects.filter(user_id_id=user_id)
+        if product_ids is not None:
+            rows = rows.filter(product_id_id__in=product_ids)
+        if self.reservations is not None:
+            held = rows.values_list('product_id_id', flat=True) if product_ids is None else product_ids
+            self.reservations.release(user_id, list(held))
+        rows.delete()
+        if product_ids is None or product_ids:
+            self._invalidate(user_id)
+
+    def apply(self, user_id, operations):
+        """
+        Apply ``operations`` (dicts with ``op`` of ``add``, ``set`` or
+        ``remove``, ``product_id`` and ``count_product``) in order, as one
+        transaction with upsert semantics: ``add`` adds to the count of a
+        product already in the cart, ``set`` inserts or overwrites it and
+        ``remove`` ignores products that are not there.
+
+        The cost is fixed whatever the number of operations: the user's rows
+        are locked and read once, products are validated and hydrated in one
+        ``IN`` query, and the changes are written with one upsert and one
+        delete. Returns the resulting cart as ``[(product, count)]`` in
+        product id order, or raises ``UnknownProductsError``.
+        """
+        with transaction.atomic():
+            current = dict(
+                ShoppingCart.objects.select_for_update().filter(user_id_id=user_id)
+                .values_list('product_id_id', 'count_product')
+            )
+            items = dict(current)
+            for operation in operations:
+                product_id = operation['product_id']
+                if operation['op'] == 'remove':
+                    items.pop(product_id, None)
+                elif operation['op'] == 'add':
+                    items[product_id] = items.get(product_id, 0) + operation['count_product']
+                else:
+                    items[product_id] = operation['count_product']
+
+            products = {
+                product.id: product
+                for product in ProductListSerializer.setup_eager_loading(
+                    Product.objects.filter(id__in=set(items) | {operation['product_id'] for operation in operations})
+                )
+            }
+            unknown = sorted({operation['product_id'] for operation in operations
+                              if operation['op'] != 'remove'} - set(products))
+            if unknown:
+                raise UnknownProductsError(unknown)
+
+            changed = [product_id for product_id, count in items.items() if current.get(product_id) != count]
+            if changed:
+                ShoppingCart.objects.bulk_create(
+                    [ShoppingCart(user_id_id=user_id, product_id_id=product_id, count_product=items[product_id])
+                     for product_id in changed],
+                    update_conflicts=True,
+                    unique_fields=['user_id', 'product_id'],
+                    update_fields=['count_product'],
+                )
+            removed = [product_id for product_id in current if product_id not in items]
+            if removed:
+                ShoppingCart.objects.filter(user_id_id=user_id, product_id_id__in=removed).delete()
+            self._hold(user_id, {product_id: items.get(product_id, 0) for product_id in changed + removed})
+            if changed or removed:
+                self._invalidate(user_id)
+
+        return [(products[product_id], items[product_id]) for product_id in sorted(items) if product_id in products]
+
+    def products(self, user_id):
+        """
+        The products in the cart with their counts, hydrated with one ``IN``
+        query, as ``[(product, count)]`` in product id order.
+        """
+        if self.client is None:
+            rows = ShoppingCart.objects.filter(user_id_id=user_id).select_related('product_id__category')
+            return [(row.product_id, row.count_product) for row in rows.order_by('product_id')]
+
+        items = self.items(user_id)
+        if not items:
+            return []
+        products = ProductListSerializer.setup_eager_loading(Product.objects.filter(id__in=items)).order_by('id')
+        return [(product, items[product.id]) for product in products]
+
+
+def get_cart_store():
+    return CartStore(get_redis())
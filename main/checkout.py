@@ -0,0 +1,136 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from customer.discounts import get_active_discounts
+from customer.models import ShippingAddress
+from .carts import get_cart_store
+from .leaderboards import record_sales
+from .reservations import get_reservations
+from .models import Product, ShoppingCart, Order, OrderItem
+
+CENT = Decimal('0.01')
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    def __init__(self):
+        super().__init__('Shopping cart is empty!')
+
+
+class MissingShippingAddressError(CheckoutError):
+    def __init__(self):
+        super().__init__('Shipping address not found!')
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, shortages):
+        super().__init__('Not enough products in stock!')
+        # [{'product_id', 'requested', 'available'}]
+        self.shortages = shortages
+
+
+def active_discounts(products):
+    """
+    ``{product_id: percentage}`` of the best discount running now for each
+    product, from its own and its category's discounts, read from the
+    cached active-discount index.
+    """
+    index = get_active_discounts()
+    return {
+        product.id: max(index['product_percentages'].get(product.id, 0),
+                        index['category_percentages'].get(product.category_id, 0))
+        for product in products
+    }
+
+
+def build_order_items(products, quantities, discounts):
+    """Line items snapshotting price, discount and quantity, with their totals rounded to cents."""
+    items = []
+    for product in products:
+        unit_price = Decimal(str(product.price)).quantize(CENT)
+        quantity = quantities[product.id]
+        percentage = discounts.get(product.id, 0)
+        subtotal = unit_price * quantity
+        discount = (subtotal * Decimal(str(percentage)) / 100).quantize(CENT)
+        items.append(OrderItem(product=product, product_name=product.name, unit_price=unit_price,
+                               discount_percentage=percentage, quantity=quantity, total=subtotal - discount))
+    return items
+
+
+def stock_shortages(products, quantities):
+    return [
+        {'product_id': product.id, 'requested': quantities[product.id], 'available': product.quantity}
+        for product in products if product.quantity < quantities[product.id]
+    ]
+
+
+def checkout(user_id):
+    """
+    Turn the user's cart into one order in a single transaction and return it.
+
+    The cart rows are locked with ``SELECT ... FOR UPDATE``. When every
+    product of the cart is still held for the user (``main.reservations``),
+    the holds are consumed and the stock taken without locking or
+    re-checking the product rows flash sales contend for. Otherwise the
+    products are locked in id order, so concurrent checkouts of overlapping
+    carts always queue instead of deadlocking, and stock is checked under
+    the lock. Either way the stock is then taken and ``sold_quantity``
+    raised in a single conditional UPDATE, the order header and its line
+    items are written with two INSERTs and the cart rows removed with one
+    DELETE, so the number of queries does not depend on the size of the
+    cart.
+    """
+    reservations = get_reservations()
+    consumed = False
+    try:
+        with transaction.atomic():
+            shipping_address = ShippingAddress.objects.filter(user_id=user_id).order_by('id').first()
+            if shipping_address is None:
+                raise MissingShippingAddressError()
+
+            items = dict(
+                ShoppingCart.objects.select_for_update().filter(user_id_id=user_id)
+                .values_list('product_id_id', 'count_product')
+            )
+            if not items:
+                raise EmptyCartError()
+
+            consumed = reservations is not None and reservations.consume(user_id, items)
+            if consumed:
+                products = list(Product.objects.filter(id__in=items).order_by('id'))
+            else:
+                products = list(Product.objects.select_for_update().filter(id__in=items).order_by('id'))
+                shortages = stock_shortages(products, items)
+                if shortages:
+                    raise InsufficientStockError(shortages)
+                if reservations is not None:
+                    # Stock taken without holds; reload the counters from the new quantities
+                    transaction.on_commit(lambda: reservations.forget(list(items)))
+
+            sales = [(product.id, product.category_id, items[product.id]) for product in products]
+            if record_sales(sales, take_stock=True) < len(products):
+                # Only reached with holds, when the stock was lowered by other means
+                raise InsufficientStockError(stock_shortages(Product.objects.filter(id__in=items), items))
+
+            order_items = build_order_items(products, items, active_discounts(products))
+            subtotal = sum((item.unit_price * item.quantity for item in order_items), Decimal(0))
+            total = sum((item.total for item in order_items), Decimal(0))
+            order = Order.objects.create(
+                user_id=user_id, shipping_address=shipping_address,
+                item_count=sum(item.quantity for item in order_items),
+                subtotal=subtotal, discount_total=subtotal - total, total=total,
+            )
+            for item in order_items:
+                item.order = order
+            OrderItem.objects.bulk_create(order_items)
+            get_cart_store().clear(user_id, product_ids=list(items))
+    except Exception:
+        if consumed:
+            # The consumed units are neither sold nor held any more
+            reservations.forget(list(items))
+        raise
+    return order
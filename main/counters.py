@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.db.models import Count, F, Case, When, Value, IntegerField, OuterRef, Subquery
+
+from customer.models import DiscountCategory
+from .cache import bump_version, reference_caches, PRODUCTS_BY_CATEGORY_CACHE_KEY
+from .models import Category
+
+
+def invalidate_category_counts(discounts=True):
+    reference_caches['category'].invalidate()
+    cache.delete(PRODUCTS_BY_CATEGORY_CACHE_KEY)
+    if discounts:
+        bump_version('discount')
+
+
+def adjust_product_counts(deltas):
+    """
+    Apply ``{category_id: delta}`` to ``Category.count_product`` and to the
+    ``DiscountCategory`` rows of those categories with atomic ``F()``
+    updates, so concurrent writers never overwrite each other's counts.
+    """
+    deltas = {category_id: delta for category_id, delta in deltas.items() if category_id is not None and delta}
+    if not deltas:
+        return
+
+    for model, field in ((Category, 'id'), (DiscountCategory, 'category_id')):
+        for category_id, delta in deltas.items():
+            model.objects.filter(**{field: category_id}).update(count_product=F('count_product') + delta)
+    invalidate_category_counts()
+
+
+def reconcile_product_counts():
+    """
+    Recompute drifted ``count_product`` values: one grouped query finds the
+    categories whose stored count differs from their product count and one
+    UPDATE fixes them; the discount rows are then copied from their category
+    in a single UPDATE. Returns the number of rows fixed.
+    """
+    drifted = list(
+        Category.objects.annotate(actual=Count('product'))
+        .exclude(count_product=F('actual'))
+        .values_list('id', 'actual')
+    )
+    if drifted:
+        Category.objects.filter(id__in=[category_id for category_id, actual in drifted]).update(count_product=Case(
+            *[When(id=category_id, then=Value(actual)) for category_id, actual in drifted],
+            output_field=IntegerField()
+        ))
+
+    fixed_discounts = DiscountCategory.objects.exclude(count_product=F('category__count_product')).update(
+        count_product=Subquery(Category.objects.filter(id=OuterRef('category_id')).values('count_product')[:1])
+    )
+
+    if drifted or fixed_discounts:
+        invalidate_category_counts(discounts=bool(fixed_discounts))
+    return len(drifted) + fixed_discounts
@@ -0,0 +1,97 @@
+import itertools
+import json
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Product, ProductSizeColor, File
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+PRODUCT_EXPORT_FIELDS = (
+    'id', 'name', 'description', 'price', 'rate', 'quantity', 'sold_quantity', 'created_at',
+    'category_id', 'category__name',
+)
+
+
+def dumps_line(row):
+    if orjson is not None:
+        return orjson.dumps(row) + b'\n'
+    return json.dumps(row, separators=(',', ':'), ensure_ascii=False).encode() + b'\n'
+
+
+def iter_export_rows(after_id=None, chunk_size=None):
+    """
+    Yield every product after ``after_id`` in id order with its category,
+    variants and file hashes.
+
+    Products are read through a server-side cursor (``iterator()``) and the
+    variants and files of each chunk are fetched with one ``IN`` query each,
+    so memory is bounded by ``chunk_size`` whatever the catalog size.
+    """
+    chunk_size = chunk_size or settings.PRODUCT_EXPORT_CHUNK_SIZE
+    queryset = Product.objects.order_by('id')
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    products = queryset.values(*PRODUCT_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(itertools.islice(products, chunk_size))
+        if not chunk:
+            break
+        product_ids = [product['id'] for product in chunk]
+
+        variants = defaultdict(list)
+        for variant in ProductSizeColor.objects.filter(product_id__in=product_ids).order_by('id').values(
+            'product_id', 'size_id', 'size__name', 'color_id', 'color__name'
+        ):
+            variants[variant['product_id']].append({
+                'size': None if variant['size_id'] is None else
+                {'id': variant['size_id'], 'name': variant['size__name']},
+                'color': None if variant['color_id'] is None else
+                {'id': variant['color_id'], 'name': variant['color__name']},
+            })
+
+        files = defaultdict(list)
+        for product_id, file_hash in File.objects.filter(product_id__in=product_ids).order_by('id').values_list(
+            'product_id', 'hash'
+        ):
+            files[product_id].append(file_hash)
+
+        for product in chunk:
+            yield {
+                'id': product['id'],
+                'name': product['name'],
+                'description': product['description'],
+                'price': product['price'],
+                'rate': product['rate'],
+                'quantity': product['quantity'],
+                'sold_quantity': product['sold_quantity'],
+                'created_at': product['created_at'].isoformat(),
+                'category': {'id': product['category_id'], 'name': product['category__name']},
+                'variants': variants[product['id']],
+                'files': files[product['id']],
+            }
+
+
+def export_products(after_id=None, compress=False, chunk_size=None):
+    """
+    The catalog as NDJSON byte chunks, one product per line, optionally as a
+    gzip stream. Every line carries the product ``id``, so an interrupted
+    export resumes with ``after_id`` set to the last id received.
+    """
+    lines = (dumps_line(row) for row in iter_export_rows(after_id, chunk_size))
+    if not compress:
+        yield from lines
+        return
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for line in lines:
+        data = compressor.compress(line)
+        if data:
+            yield data
+    yield compressor.flush()
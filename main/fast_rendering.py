@@ -0,0 +1,84 @@
+from functools import lru_cache
+
+from rest_framework import serializers
+
+
+class RowSerializer:
+    """
+    A serializer compiled into plain field extractors over ``.values()``
+    rows, producing the same dicts as ``serializer_class(many=True).data``
+    without building model instances or walking DRF fields per row.
+
+    Supports the field types of the read-only listing serializers: plain
+    model fields, primary-key relations and nested model serializers, and
+    the ``finalize_rows(rows, context)`` hook of their list serializer.
+    """
+
+    def __init__(self, serializer_class):
+        self.paths = []
+        self.extractors = self._compile(serializer_class(), '')
+        list_serializer_class = getattr(serializer_class.Meta, 'list_serializer_class', None)
+        self.finalize_rows = getattr(list_serializer_class, 'finalize_rows', None)
+
+    def _compile(self, serializer, prefix):
+        extractors = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+
+            path = prefix + field.source.replace('.', '__')
+            if isinstance(field, serializers.BaseSerializer):
+                nested = self._compile(field, path + '__')
+                key = path + '__' + field.Meta.model._meta.pk.attname
+                self._add_path(key)
+                extractors.append((name, self._nested(key, nested)))
+            else:
+                self._add_path(path)
+                extractors.append((name, self._leaf(path, field)))
+        return extractors
+
+    def _add_path(self, path):
+        if path not in self.paths:
+            self.paths.append(path)
+
+    @staticmethod
+    def _nested(key, extractors):
+        def extract(row):
+            if row[key] is None:
+                return None
+            return {name: extractor(row) for name, extractor in extractors}
+        return extract
+
+    @staticmethod
+    def _leaf(path, field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            convert = None
+        elif isinstance(field, serializers.IntegerField):
+            convert = int
+        elif isinstance(field, serializers.FloatField):
+            convert = float
+        elif isinstance(field, serializers.CharField):
+            convert = str
+        else:
+            convert = field.to_representation
+
+        def extract(row):
+            value = row[path]
+            if value is None or convert is None:
+                return value
+            return convert(value)
+        return extract
+
+    def __call__(self, row):
+        return {name: extractor(row) for name, extractor in self.extractors}
+
+    def many(self, rows, context=None):
+        rows = [self(row) for row in rows]
+        if self.finalize_rows is not None:
+            rows = self.finalize_rows(rows, context or {})
+        return rows
+
+
+@lru_cache(maxsize=None)
+def get_row_serializer(serializer_class):
+    return RowSerializer(serializer_class)
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import ProductSizeColor
+
+RATING_FACETS = (1, 2, 3, 4, 5)
+
+
+def product_filter_conditions(params):
+    """
+    Split the category, price range and rating filters into one condition per
+    facet dimension, so facets can leave their own dimension out.
+    """
+    category_id = params.get('category_id')
+    start_price = params.get('start_price')
+    end_price = params.get('end_price')
+    rate = params.get('rate')
+
+    conditions = {'category': Q(), 'price': Q(), 'rate': Q()}
+    if category_id:
+        conditions['category'] = Q(category_id=category_id)
+    if start_price and end_price:
+        conditions['price'] = Q(price__gte=start_price, price__lte=end_price)
+    if rate:
+        conditions['rate'] = Q(rate__gte=rate)
+    return conditions
+
+
+def filter_products(query, params):
+    """Apply the category, price range and rating filters shared by filter and search."""
+    return query.filter(*product_filter_conditions(params).values())
+
+
+def price_buckets():
+    edges = settings.PRODUCT_PRICE_FACETS
+    return [(low, high) for low, high in zip(edges, edges[1:])] + [(edges[-1], None)]
+
+
+def product_facets(query, params):
+    """
+    Facet counts for the filter sheet in a fixed four queries: one conditional
+    aggregate for the rating and price buckets, and one GROUP BY each for
+    categories, sizes and colors.
+
+    Each facet is counted with every filter applied except its own, so
+    picking "4★+" still shows how many products the other ratings have.
+    """
+    conditions = product_filter_conditions(params)
+    category_q, price_q, rate_q = conditions['category'], conditions['price'], conditions['rate']
+
+    buckets = price_buckets()
+    aggregates = {
+        f'rating_{rating}': Count('id', filter=Q(rate__gte=rating) & category_q & price_q)
+        for rating in RATING_FACETS
+    }
+    for index, (low, high) in enumerate(buckets):
+        bucket_q = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'price_{index}'] = Count('id', filter=bucket_q & category_q & rate_q)
+    counts = query.aggregate(**aggregates)
+
+    categories = (
+        query.filter(price_q, rate_q)
+        .values('category_id', 'category__name')
+        .annotate(count=Count('id'))
+        .order_by('category_id')
+    )
+
+    variants = ProductSizeColor.objects.filter(product__in=query.filter(category_q, price_q, rate_q).values('id'))
+    sizes = (
+        variants.filter(size__isnull=False)
+        .values('size_id', 'size__name')
+        .annotate(count=Count('product_id', distinct=True))
+        .order_by('size_id')
+    )
+    colors = (
+        variants.filter(color__isnull=False)
+        .values('color_id', 'color__name')
+        .annotate(count=Count('product_id', distinct=True))
+        .order_by('color_id')
+    )
+
+    return {
+        'categories': [
+            {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+            for row in categories
+        ],
+        'rating': [
+            {'min_rate': rating, 'count': counts[f'rating_{rating}']}
+            for rating in RATING_FACETS
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': counts[f'price_{index}']}
+            for index, (low, high) in enumerate(buckets)
+        ],
+        'sizes': [
+            {'id': row['size_id'], 'name': row['size__name'], 'count': row['count']}
+            for row in sizes
+        ],
+        'colors': [
+            {'id': row['color_id'], 'name': row['color__name'], 'count': row['count']}
+            for row in colors
+        ],
+    }
@@ -0,0 +1,239 @@
+import csv
+import itertools
+import json
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction, DatabaseError
+
+from .cache import bump_version, reference_caches
+from .counters import adjust_product_counts
+from .leaderboards import get_leaderboard, update_leaderboard
+from .models import Product, Category, Size, Color, ProductSizeColor
+from .search import get_search_backend
+from .serializers import ProductImportRowSerializer
+
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+# Separator of the sizes and colors columns of a CSV feed, e.g. "S|M|L"
+CSV_LIST_SEPARATOR = '|'
+CSV_LIST_COLUMNS = ('sizes', 'colors')
+
+
+def detect_format(path):
+    file_format = IMPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format is None:
+        raise ValueError(f'Cannot tell the format of {path}, expected one of {", ".join(IMPORT_FORMATS)}')
+    return file_format
+
+
+def read_csv(stream):
+    """Yield ``(line_number, row)`` from a CSV feed with a header line."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # Empty cells fall back to the serializer defaults
+        row = {key: value for key, value in row.items() if key and value not in ('', None)}
+        for column in CSV_LIST_COLUMNS:
+            if column in row:
+                row[column] = [item.strip() for item in row[column].split(CSV_LIST_SEPARATOR) if item.strip()]
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    """Yield ``(line_number, row)`` from a feed with one JSON object per line."""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = e
+        yield line_number, row
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+class ImportReport:
+    """
+    Progress and per-row errors of an import, one JSON object per line so the
+    file can be followed while the import runs.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, event, **data):
+        self.file.write(json.dumps({'event': event, **data}, default=str) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ProductImporter:
+    """
+    Imports a stream of product rows with ``bulk_create`` in batches of
+    ``batch_size``, keeping only one batch in memory.
+
+    ``bulk_create`` fires no signals, so the work of the Product receivers is
+    done here once per batch: one ``count_product`` increment per affected
+    category, the search index, the leaderboards and the cache versions.
+    """
+
+    def __init__(self, report, batch_size=None):
+        self.report = report
+        self.batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+        self.categories = set()
+        self.sizes = {}
+        self.colors = {}
+        self.created_references = set()
+        self.rows = 0
+        self.created = 0
+        self.errors = 0
+
+    def run(self, rows):
+        self.report.write('started', batch_size=self.batch_size)
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            self.report.write('progress', rows=self.rows, created=self.created, errors=self.errors)
+
+        self.finish()
+        summary = {'rows': self.rows, 'created': self.created, 'errors': self.errors}
+        self.report.write('finished', **summary)
+        return summary
+
+    def error(self, line_number, errors):
+        self.errors += 1
+        self.report.write('error', line=line_number, errors=errors)
+
+    def validate(self, batch):
+        valid = []
+        for line_number, row in batch:
+            self.rows += 1
+            if isinstance(row, Exception):
+                self.error(line_number, {'non_field_errors': [str(row)]})
+                continue
+            if not isinstance(row, dict):
+                self.error(line_number, {'non_field_errors': ['Expected a JSON object']})
+                continue
+            serializer = ProductImportRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((line_number, serializer.validated_data))
+            else:
+                self.error(line_number, serializer.errors)
+
+        unknown = {row['category_id'] for line_number, row in valid} - self.categories
+        if unknown:
+            self.categories.update(Category.objects.filter(id__in=unknown).values_list('id', flat=True))
+
+        rows = []
+        for line_number, row in valid:
+            if row['category_id'] in self.categories:
+                rows.append(row)
+            else:
+                self.error(line_number, {'category_id': [f'Category {row["category_id"]} does not exist']})
+        return rows
+
+    def resolve(self, model, known, names):
+        """Map size or color names to ids, creating the missing ones in bulk."""
+        missing = set(names) - set(known)
+        if not missing:
+            return
+        for pk, name in model.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+            known[name] = pk
+        missing -= set(known)
+        if missing:
+            for instance in model.objects.bulk_create([model(name=name) for name in sorted(missing)]):
+                known[instance.name] = instance.pk
+            self.created_references.add(model._meta.model_name)
+
+    def import_batch(self, batch):
+        rows = self.validate(batch)
+        if not rows:
+            return
+
+        try:
+            with transaction.atomic():
+                self.resolve(Size, self.sizes, {name for row in rows for name in row['sizes']})
+                self.resolve(Color, self.colors, {name for row in rows for name in row['colors']})
+
+                products = Product.objects.bulk_create([
+                    Product(
+                        name=row['name'], description=row['description'], price=row['price'],
+                        rate=row['rate'], quantity=row['quantity'], sold_quantity=row['sold_quantity'],
+                        category_id=row['category_id'],
+                    )
+                    for row in rows
+                ])
+
+                variants = []
+                for product, row in zip(products, rows):
+                    size_ids = [self.sizes[name] for name in row['sizes']] or [None]
+                    color_ids = [self.colors[name] for name in row['colors']] or [None]
+                    variants.extend(
+                        ProductSizeColor(product_id=product.pk, size_id=size_id, color_id=color_id)
+                        for size_id, color_id in itertools.product(size_ids, color_ids)
+                        if size_id is not None or color_id is not None
+                    )
+                ProductSizeColor.objects.bulk_create(variants)
+                adjust_product_counts(Counter(product.category_id for product in products))
+        except DatabaseError as e:
+            # Sizes and colors created by the failed batch were rolled back
+            self.sizes.clear()
+            self.colors.clear()
+            self.errors += len(rows)
+            self.report.write('batch_failed', rows=len(rows), error=str(e))
+            return
+
+        self.created += len(products)
+
+        search_backend = get_search_backend()
+        for product in products:
+            search_backend.update(product)
+        leaderboard = get_leaderboard()
+        if leaderboard is not None:
+            update_leaderboard(leaderboard.add_many,
+                               [(product.pk, product.category_id, product.sold_quantity) for product in products])
+        bump_version('product')
+
+    def finish(self):
+        for namespace in self.created_references:
+            reference_caches[namespace].invalidate()
+
+
+def import_products(path, report_path, file_format=None, batch_size=None):
+    """Import the CSV or JSONL feed at ``path``, writing the report to ``report_path``."""
+    file_format = file_format or detect_format(path)
+    report = ImportReport(report_path)
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            return ProductImporter(report, batch_size).run(READERS[file_format](stream))
+    except Exception as e:
+        report.write('failed', error=str(e))
+        raise
+    finally:
+        report.close()
+
+
+def read_report_status(path, block_size=4096):
+    """The last event of a report, read from the end of the file."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') < 2:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.strip().splitlines()
+    return json.loads(lines[-1]) if lines else None
@@ -0,0 +1,196 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
+
+from .cache import bump_version, PRODUCTS_BY_CATEGORY_CACHE_KEY
+from .models import Product
+from .product_detail import invalidate_product_detail
+from .redis_store import get_redis
+from .tasks import rebuild_leaderboards
+
+ALL_CATEGORIES = 'all'
+
+# Rebuilds queued by readers finding the leaderboards gone, at most one per timeout
+REBUILD_REQUEST_KEY = 'leaderboard:rebuild-requested'
+REBUILD_REQUEST_TIMEOUT = 60 * 5
+
+
+class RedisLeaderboard:
+    """
+    Top sellers kept as one Redis sorted set per category (plus one for the
+    whole catalog), scored by ``sold_quantity``.
+
+    Members are zero padded product ids, so products with the same score come
+    back in ``-id`` order exactly like the database fallback
+    ``ORDER BY sold_quantity DESC, id DESC``.
+    """
+    key_prefix = 'leaderboard:category:'
+    rebuild_chunk_size = 5000
+
+    def __init__(self, client):
+        self.client = client
+
+    def key(self, category_id):
+        return f'{self.key_prefix}{category_id}'
+
+    @staticmethod
+    def member(product_id):
+        return f'{product_id:012d}'
+
+    def add(self, product_id, category_id, sold_quantity, previous_category_id=None):
+        member = self.member(product_id)
+        pipe = self.client.pipeline()
+        if previous_category_id is not None and previous_category_id != category_id:
+            pipe.zrem(self.key(previous_category_id), member)
+        pipe.zadd(self.key(category_id), {member: sold_quantity})
+        pipe.zadd(self.key(ALL_CATEGORIES), {member: sold_quantity})
+        pipe.execute()
+
+    def add_many(self, products):
+        """``products`` is an iterable of ``(product_id, category_id, sold_quantity)``."""
+        pipe = self.client.pipeline()
+        for product_id, category_id, sold_quantity in products:
+            member = self.member(product_id)
+            pipe.zadd(self.key(category_id), {member: sold_quantity})
+            pipe.zadd(self.key(ALL_CATEGORIES), {member: sold_quantity})
+        pipe.execute()
+
+    def remove(self, product_id, category_id):
+        member = self.member(product_id)
+        pipe = self.client.pipeline()
+        pipe.zrem(self.key(category_id), member)
+        pipe.zrem(self.key(ALL_CATEGORIES), member)
+        pipe.execute()
+
+    def record_sales(self, sales):
+        """``sales`` is an iterable of ``(product_id, category_id, quantity)``."""
+        pipe = self.client.pipeline()
+        for product_id, category_id, quantity in sales:
+            member = self.member(product_id)
+            pipe.zincrby(self.key(category_id), quantity, member)
+            pipe.zincrby(self.key(ALL_CATEGORIES), quantity, member)
+        pipe.execute()
+
+    def top(self, category_id, offset, count, min_sold=None):
+        """
+        Product ids ranked ``offset .. offset + count`` in O(log n + count),
+        or ``None`` when the sorted set does not exist (never filled, flushed
+        or evicted) and only the database can answer.
+        """
+        key = self.key(ALL_CATEGORIES if category_id is None else category_id)
+        pipe = self.client.pipeline()
+        pipe.exists(key)
+        if min_sold is None:
+            pipe.zrevrange(key, offset, offset + count - 1)
+        else:
+            pipe.zrevrangebyscore(key, '+inf', min_sold, start=offset, num=count)
+        exists, members = pipe.execute()
+        if not exists:
+            return None
+        return [int(member) for member in members]
+
+    def request_rebuild(self):
+        """
+        Queue a rebuild when the whole-catalog set is gone, e.g. after a
+        deploy to a fresh Redis or a flush. A single missing category set is
+        left to the database, as categories without products have none.
+        """
+        if self.client.exists(self.key(ALL_CATEGORIES)):
+            return
+        if cache.add(REBUILD_REQUEST_KEY, 1, timeout=REBUILD_REQUEST_TIMEOUT):
+            try:
+                rebuild_leaderboards.delay()
+            except OperationalError:
+                cache.delete(REBUILD_REQUEST_KEY)
+
+    def rebuild(self):
+        rows = Product.objects.values_list('id', 'category_id', 'sold_quantity').order_by('id').iterator(
+            chunk_size=self.rebuild_chunk_size
+        )
+        scores = {}
+        for product_id, category_id, sold_quantity in rows:
+            member = self.member(product_id)
+            scores.setdefault(category_id, {})[member] = sold_quantity
+            scores.setdefault(ALL_CATEGORIES, {})[member] = sold_quantity
+
+        # Build under temporary keys and swap them in, so readers never see
+        # a half-filled leaderboard.
+        pipe = self.client.pipeline()
+        stale_keys = set(self.client.scan_iter(match=f'{self.key_prefix}*'))
+        for category_id, members in scores.items():
+            key = self.key(category_id)
+            items = list(members.items())
+            pipe.delete(f'{key}:rebuild')
+            for start in range(0, len(items), self.rebuild_chunk_size):
+                pipe.zadd(f'{key}:rebuild', dict(items[start:start + self.rebuild_chunk_size]))
+            pipe.rename(f'{key}:rebuild', key)
+            stale_keys.discard(key.encode())
+        if stale_keys:
+            pipe.delete(*stale_keys)
+        pipe.execute()
+
+
+def record_sales(sales, take_stock=False):
+    """
+    Add sold quantities to ``Product.sold_quantity`` in a single UPDATE and
+    to the leaderboards. ``sales`` holds ``(product_id, category_id, quantity)``.
+    With ``take_stock`` the same UPDATE also subtracts them from ``quantity``,
+    skipping products with fewer units in stock. Returns the number of
+    products updated. The caches and the leaderboards are only updated once
+    the transaction commits.
+    """
+    sales = list(sales)
+    if not sales:
+        return 0
+
+    quantities = defaultdict(int)
+    for product_id, category_id, quantity in sales:
+        quantities[product_id] += quantity
+    sold = Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField()
+    )
+    changes = {'sold_quantity': F('sold_quantity') + sold}
+    products = Product.objects.filter(id__in=quantities)
+    if take_stock:
+        changes['quantity'] = F('quantity') - sold
+        products = products.filter(quantity__gte=sold)
+    updated = products.update(**changes)
+
+    def invalidate():
+        # After commit, so no reader caches the old stock under the new version
+        bump_version('product')
+        for product_id in quantities:
+            invalidate_product_detail(product_id)
+        # The home feed shows quantity and sold_quantity and is only dropped by invalidation
+        cache.delete(PRODUCTS_BY_CATEGORY_CACHE_KEY)
+    transaction.on_commit(invalidate)
+
+    leaderboard = get_leaderboard()
+    if leaderboard is not None:
+        transaction.on_commit(lambda: update_leaderboard(leaderboard.record_sales, sales))
+    return updated
+
+
+def update_leaderboard(func, *args, **kwargs):
+    """
+    Apply a write to the leaderboard, best effort: the database is the
+    source of truth and the nightly rebuild catches a missed write up, so a
+    Redis failure never fails the write it follows.
+    """
+    try:
+        func(*args, **kwargs)
+    except RedisError:
+        pass
+
+
+def get_leaderboard():
+    """The Redis leaderboard, or ``None`` to read the indexed Product table."""
+    client = get_redis()
+    if client is None:
+        return None
+    return RedisLeaderboard(client)
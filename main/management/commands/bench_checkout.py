@@ -0,0 +1,85 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from customer.models import Country, State, City, ShippingAddress
+from main.checkout import checkout, InsufficientStockError
+from main.models import Category, Product, ShoppingCart
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent checkouts of the same product and check that stock is never oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=300, help='Concurrent checkouts')
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--stock', type=int, default=200)
+        parser.add_argument('--count', type=int, default=1, help='Items per checkout')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The checkout benchmark needs PostgreSQL row locks')
+
+        prefix = f'bench-checkout-{int(time.time())}'
+        category = Category.objects.create(name=prefix)
+        product = Product.objects.create(name=prefix, description='', price=1, category=category,
+                                         quantity=options['stock'])
+        country = Country.objects.create(name='Bench')
+        state = State.objects.create(state='Bench', country=country)
+        city = City.objects.create(city='Bench', state=state)
+        users = User.objects.bulk_create([User(username=f'{prefix}-{index}') for index in range(options['users'])])
+        ShippingAddress.objects.bulk_create([
+            ShippingAddress(user=user, phone_number='0', postal_code='0', street_address='0', house_number='0',
+                            state=state, city=city, country=country)
+            for user in users
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user_id=user, product_id=product, count_product=options['count']) for user in users
+        ])
+
+        def run(user):
+            started = time.perf_counter()
+            try:
+                checkout(user.id)
+                outcome = 'ordered'
+            except InsufficientStockError:
+                outcome = 'out_of_stock'
+            except Exception as e:
+                outcome = f'error: {e.__class__.__name__}'
+            finally:
+                connections.close_all()
+            return outcome, time.perf_counter() - started
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                results = list(executor.map(run, users))
+            elapsed = time.perf_counter() - started
+
+            outcomes = {}
+            for outcome, _ in results:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            latencies = sorted(latency for _, latency in results)
+            product.refresh_from_db()
+
+            ordered = outcomes.get('ordered', 0)
+            self.stdout.write(f'checkouts: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s)')
+            for outcome, total in sorted(outcomes.items()):
+                self.stdout.write(f'  {outcome}: {total}')
+            self.stdout.write(f'latency p50 {statistics.median(latencies) * 1000:.1f} ms, '
+                              f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms')
+            self.stdout.write(f'stock left: {product.quantity}, sold: {product.sold_quantity}')
+
+            expected = options['stock'] - ordered * options['count']
+            if product.quantity != expected or product.quantity < 0:
+                raise CommandError(f'Stock is {product.quantity}, expected {expected}')
+            self.stdout.write(self.style.SUCCESS('No overselling'))
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+            product.delete()
+            category.delete()
+            country.delete()
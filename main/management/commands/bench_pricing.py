@@ -0,0 +1,73 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.pricing import PricingEngine, discounted_prices
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized effective-price engine with a per-row loop on in-memory product pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--discounted', type=float, default=0.2,
+                            help='Share of products with a discount of their own')
+        parser.add_argument('--promo', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        generator = random.Random(0)
+        index = self.build_index(options['rows'], options['categories'], options['discounted'], generator)
+        rows = self.build_rows(options['rows'], options['categories'], generator)
+        promo = options['promo']
+
+        def loop():
+            # The per-product lookups and arithmetic a serializer method field would do
+            for row in rows:
+                percentage = max(index['product_percentages'].get(row['id'], 0),
+                                 index['category_percentages'].get(row['category']['id'], 0))
+                row['effective_price'] = float(discounted_prices(row['price'], percentage, promo))
+            return [row['effective_price'] for row in rows]
+
+        def vectorized():
+            PricingEngine(index).price_rows(rows, promo)
+            return [row['effective_price'] for row in rows]
+
+        if loop() != vectorized():
+            raise CommandError('The engine does not compute the same prices as the per-row loop')
+
+        loop_time = self.best_of(loop, options['repeat'])
+        engine_time = self.best_of(vectorized, options['repeat'])
+        self.stdout.write(f'rows: {len(rows)}')
+        self.stdout.write(f'per-row loop:       {loop_time * 1000:.1f} ms')
+        self.stdout.write(f'PricingEngine:      {engine_time * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'speedup: {loop_time / engine_time:.1f}x'))
+
+    @staticmethod
+    def build_index(total, categories, discounted, generator):
+        products = generator.sample(range(1, total + 1), int(total * discounted))
+        return {
+            'etag': 'discount.bench',
+            'product_percentages': {product_id: generator.randint(5, 60) for product_id in products},
+            'category_percentages': {category_id: generator.randint(5, 30)
+                                     for category_id in range(1, categories + 1, 3)},
+        }
+
+    @staticmethod
+    def build_rows(total, categories, generator):
+        return [
+            {'id': index, 'price': round(generator.uniform(1, 2000), 2),
+             'category': {'id': generator.randint(1, categories), 'name': 'Category'}}
+            for index in range(1, total + 1)
+        ]
+
+    @staticmethod
+    def best_of(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
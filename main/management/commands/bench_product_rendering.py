@@ -0,0 +1,78 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from main.fast_rendering import get_row_serializer
+from main.models import Category, Product
+from main.renderers import FastJSONRenderer
+from main.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the DRF and the fast rendering path of product listings on in-memory rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        products = self.build_products(options['rows'])
+        row_serializer = get_row_serializer(ProductListSerializer)
+        rows = [self.as_row(product, row_serializer.paths) for product in products]
+
+        def drf():
+            return JSONRenderer().render(ProductListSerializer(products, many=True).data)
+
+        def fast():
+            return FastJSONRenderer().render(row_serializer.many(rows))
+
+        if drf() != fast():
+            raise CommandError('The fast path does not render the same bytes as the serializer')
+
+        drf_time = self.best_of(drf, options['repeat'])
+        fast_time = self.best_of(fast, options['repeat'])
+        self.stdout.write(f'rows: {len(products)}')
+        self.stdout.write(f'serializer + JSONRenderer: {drf_time * 1000:.1f} ms')
+        self.stdout.write(f'RowSerializer + orjson:    {fast_time * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'speedup: {drf_time / fast_time:.1f}x'))
+
+    @staticmethod
+    def build_products(total):
+        categories = [Category(id=index, name=f'Category {index}', count_product=0) for index in range(1, 11)]
+        created_at = datetime.datetime(2024, 1, 1)
+        return [
+            Product(
+                id=index,
+                name=f'Product {index}',
+                description=f'Description of product {index} ' * 4,
+                rate=index % 6,
+                sold_quantity=index * 7 % 1000,
+                quantity=index % 50,
+                price=round(index * 1.37 % 500, 2),
+                category=categories[index % len(categories)],
+                created_at=created_at + datetime.timedelta(minutes=index),
+            )
+            for index in range(1, total + 1)
+        ]
+
+    @staticmethod
+    def as_row(instance, paths):
+        """The dict ``.values(*paths)`` would return for ``instance``."""
+        row = {}
+        for path in paths:
+            value = instance
+            for part in path.split('__'):
+                value = getattr(value, part)
+            row[path] = value
+        return row
+
+    @staticmethod
+    def best_of(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,76 @@
+import multiprocessing
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+
+from main.models import UserWallet, WalletTransaction
+from main.wallets import debit, InsufficientFundsError
+
+
+def pay(args):
+    user_id, amount, idempotency_key = args
+    try:
+        _, replayed = debit(user_id, amount, idempotency_key)
+        return 'replayed' if replayed else 'paid'
+    except InsufficientFundsError:
+        return 'insufficient_funds'
+    except Exception as e:
+        return f'error: {e.__class__.__name__}'
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Hammer one wallet with payments from several processes and check it is never overdrawn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=1000)
+        parser.add_argument('--processes', type=int, default=16)
+        parser.add_argument('--amount', type=Decimal, default=Decimal('7.50'))
+        parser.add_argument('--retries', type=int, default=2, help='Times every idempotency key is sent')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The wallet benchmark needs PostgreSQL row locks')
+
+        user = User.objects.create(username=f'bench-wallet-{int(time.time())}')
+        wallet = UserWallet.objects.get(user=user)
+        opening = wallet.cash
+        payments = [
+            (user.id, options['amount'], f'bench-{index}')
+            for index in range(options['payments']) for _ in range(options['retries'])
+        ]
+        # Forked workers must not share the parent's connection
+        connections.close_all()
+
+        try:
+            started = time.perf_counter()
+            with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+                results = pool.map(pay, payments, chunksize=1)
+            elapsed = time.perf_counter() - started
+
+            outcomes = {}
+            for outcome in results:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            self.stdout.write(f'requests: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s)')
+            for outcome, total in sorted(outcomes.items()):
+                self.stdout.write(f'  {outcome}: {total}')
+
+            wallet.refresh_from_db()
+            ledger = WalletTransaction.objects.filter(user=user).aggregate(total=Sum('amount'))['total']
+            debits = WalletTransaction.objects.filter(user=user, kind='debit').count()
+            self.stdout.write(f'balance: {wallet.cash}, ledger sum: {ledger}, debits: {debits}')
+
+            if wallet.cash < 0:
+                raise CommandError(f'Wallet overdrawn: {wallet.cash}')
+            if ledger != wallet.cash:
+                raise CommandError(f'Ledger sum {ledger} does not match the balance {wallet.cash}')
+            if debits != outcomes.get('paid', 0) or wallet.cash != opening - debits * options['amount']:
+                raise CommandError('A payment was charged twice or lost')
+            self.stdout.write(self.style.SUCCESS('No overdraft, every key charged at most once'))
+        finally:
+            user.delete()
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from main.exporters import export_products
+
+
+class Command(BaseCommand):
+    help = 'Stream every product with its category, variants and file hashes as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Output file, defaults to stdout')
+        parser.add_argument('--after-id', type=int, help='Resume after the last exported product id')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, help='Products per database fetch')
+
+    def handle(self, *args, **options):
+        chunks = export_products(options['after_id'], compress=options['gzip'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importers import import_products
+
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSONL feed in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, help='Rows per bulk insert')
+        parser.add_argument('--report', help='Report file, defaults to <path>.report.jsonl')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+
+        report_path = options['report'] or f'{path}.report.jsonl'
+        try:
+            summary = import_products(path, report_path, file_format=options['format'],
+                                      batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary["created"]} of {summary["rows"]} rows imported, {summary["errors"]} errors '
+            f'(report: {report_path})'
+        ))
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:06
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+FORWARD_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    CREATE OR REPLACE FUNCTION main_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER main_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON main_product
+    FOR EACH ROW EXECUTE FUNCTION main_product_search_vector_update()
+    """,
+    'UPDATE main_product SET name = name',
+    'CREATE INDEX main_product_search_vector_gin ON main_product USING gin (search_vector)',
+    'CREATE INDEX main_product_name_trgm_gin ON main_product USING gin (name gin_trgm_ops)',
+]
+
+BACKWARD_SQL = [
+    'DROP INDEX IF EXISTS main_product_name_trgm_gin',
+    'DROP INDEX IF EXISTS main_product_search_vector_gin',
+    'DROP TRIGGER IF EXISTS main_product_search_vector_trigger ON main_product',
+    'DROP FUNCTION IF EXISTS main_product_search_vector_update()',
+]
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        # Full-text search is Postgres only, other databases use the
+        # in-process index from main.search.
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(run_sql(FORWARD_SQL), run_sql(BACKWARD_SQL)),
+    ]
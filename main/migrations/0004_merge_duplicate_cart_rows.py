@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:21
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_rows(apps, schema_editor):
+    """Fold repeated (user, product) rows into the oldest one, adding up the counts."""
+    ShoppingCart = apps.get_model('main', 'ShoppingCart')
+    duplicates = (
+        ShoppingCart.objects.values('user_id_id', 'product_id_id')
+        .annotate(rows=Count('id'), first_id=Min('id'), total=Sum('count_product'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in list(duplicates):
+        ShoppingCart.objects.filter(id=duplicate['first_id']).update(count_product=duplicate['total'])
+        ShoppingCart.objects.filter(
+            user_id_id=duplicate['user_id_id'], product_id_id=duplicate['product_id_id']
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_rows, migrations.RunPython.noop),
+    ]
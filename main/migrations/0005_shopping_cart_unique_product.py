@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The rows are merged in the previous migration: on Postgres the constraint
+    # cannot be added in the same transaction as those updates.
+
+    dependencies = [
+        ('main', '0004_merge_duplicate_cart_rows'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user_id', 'product_id'), name='unique_shopping_cart_product'),
+        ),
+    ]
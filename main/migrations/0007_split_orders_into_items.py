@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+CENT = Decimal('0.01')
+
+
+def split_orders(apps, schema_editor):
+    """Turn every one-product order row into a header with one line item priced at the current price."""
+    Order = apps.get_model('main', 'Order')
+    OrderItem = apps.get_model('main', 'OrderItem')
+
+    orders = Order.objects.filter(product__isnull=False).select_related('product').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(orders.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        items = []
+        for order in batch:
+            unit_price = Decimal(str(order.product.price)).quantize(CENT)
+            total = unit_price * order.count_product
+            items.append(OrderItem(order=order, product=order.product, product_name=order.product.name,
+                                   unit_price=unit_price, quantity=order.count_product, total=total))
+            order.item_count = order.count_product
+            order.subtotal = order.total = total
+        OrderItem.objects.bulk_create(items)
+        Order.objects.bulk_update(batch, ['item_count', 'subtotal', 'total'])
+
+
+def merge_items_back(apps, schema_editor):
+    """Keep the first item of every order; the single-product rows cannot hold more."""
+    Order = apps.get_model('main', 'Order')
+    OrderItem = apps.get_model('main', 'OrderItem')
+    for item in OrderItem.objects.order_by('id').iterator():
+        Order.objects.filter(id=item.order_id, product__isnull=True).update(
+            product_id=item.product_id, count_product=item.quantity
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_order_items'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_orders, merge_items_back),
+    ]
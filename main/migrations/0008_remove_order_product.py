@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_split_orders_into_items'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='order',
+            name='count_product',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='product',
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def open_ledgers(apps, schema_editor):
+    """Record every existing balance as the opening entry of its wallet's ledger."""
+    UserWallet = apps.get_model('main', 'UserWallet')
+    WalletTransaction = apps.get_model('main', 'WalletTransaction')
+
+    wallets = UserWallet.objects.filter(user__isnull=False).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(wallets.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(user_id=wallet.user_id, kind='opening', amount=wallet.cash, balance_after=wallet.cash)
+            for wallet in batch
+        ])
+
+
+def drop_ledgers(apps, schema_editor):
+    apps.get_model('main', 'WalletTransaction').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_wallet_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(open_ledgers, drop_ledgers),
+    ]
@@ -0,0 +1,69 @@
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+
+from .cache import reference_caches
+from .fast_rendering import get_row_serializer
+from .renderers import FastJSONRenderer
+
+
+class EagerLoadingViewMixin:
+    """
+    Builds ``get_queryset()`` from the relations declared by the view's
+    serializer (see ``main.serializers.EagerLoadingMixin``), so listing N
+    rows costs the same number of queries as listing one.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
+class CachedListMixin:
+    """Serve ``list()`` from the two-tier reference cache named ``cache_namespace``."""
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            queryset = self.filter_queryset(self.get_queryset())
+            return list(self.get_serializer(queryset, many=True).data)
+
+        return Response(reference_caches[self.cache_namespace].get_or_set('list', build))
+
+
+class CachedRetrieveMixin:
+    """Serve ``retrieve()`` from the two-tier reference cache named ``cache_namespace``."""
+    cache_namespace = None
+
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            return dict(self.get_serializer(self.get_object()).data)
+
+        key = f'detail:{kwargs[self.lookup_url_kwarg or self.lookup_field]}'
+        return Response(reference_caches[self.cache_namespace].get_or_set(key, build))
+
+
+class FastListMixin:
+    """
+    Opt-in fast path for read-only listings: with ``fast_render = True`` the
+    page is read with ``.values()`` and turned into dicts by the serializer's
+    precompiled ``RowSerializer``, then rendered with orjson. The response
+    body is the same as the regular serializer path.
+    """
+    fast_render = False
+
+    def get_renderers(self):
+        if self.fast_render:
+            return [FastJSONRenderer(), BrowsableAPIRenderer()]
+        return super().get_renderers()
+
+    def paginate_and_serialize(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if self.fast_render:
+            row_serializer = get_row_serializer(serializer_class)
+            return row_serializer.many(self.paginate_queryset(queryset.values(*row_serializer.paths)),
+                                       self.get_serializer_context())
+        return serializer_class(self.paginate_queryset(queryset), many=True,
+                                context=self.get_serializer_context()).data
@@ -2,6 +2,7 @@ import datetime
 import hashlib
 from time import timezone
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
@@ -29,10 +30,36 @@ class Product(models.Model):
     price = models.FloatField()
     category = models.ForeignKey('main.Category', on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=datetime.datetime.now)
+    # Weighted tsvector of name and description, filled by a database trigger
+    search_vector = SearchVectorField(blank=True, null=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category and price so signal handlers can see changes
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The post_save receivers have seen the change, later saves start from here
+        self._loaded_category_id = self.category_id
+        self._loaded_price = self.price
+
+    class Meta:
+        # Composite keys backing the keyset pagination of product listings
+        indexes = [
+            models.Index(fields=['category', 'id']),
+            models.Index(fields=['category', 'sold_quantity', 'id']),
+            models.Index(fields=['sold_quantity', 'id']),
+            models.Index(fields=['rate', 'id']),
+            models.Index(fields=['created_at', 'id']),
+        ]
+
 
 class ProductSizeColor(models.Model):
     size = models.ForeignKey('main.Size', on_delete=models.CASCADE, blank=True, null=True)
@@ -104,6 +131,11 @@ class ShoppingCart(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=datetime.datetime.now)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'product_id'], name='unique_shopping_cart_product'),
+        ]
+
 
 class PromoCode(models.Model):
     code = models.CharField(max_length=20, unique=True)
@@ -117,9 +149,17 @@ class PromoCode(models.Model):
         return self.start_date <= timezone.now() <= self.end_date and self.current_usage < self.max_usage
 
     def use(self):
-        if self.is_valid():
-            self.current_usage += 1
-            self.save()
+        """
+        Count one use with a single conditional UPDATE, so concurrent uses
+        never go past ``max_usage``. Returns ``False`` when the code is
+        outside its window or used up.
+        """
+        now = timezone.now()
+        return bool(
+            PromoCode.objects.filter(pk=self.pk, start_date__lte=now, end_date__gte=now,
+                                     current_usage__lt=models.F('max_usage'))
+            .update(current_usage=models.F('current_usage') + 1)
+        )
 
     def __str__(self):
         return self.code
@@ -128,23 +168,76 @@ class PromoCode(models.Model):
 class Order(models.Model):
     STATUS_CHOICES = (
         ('processing', 'Processing'),
-        ('completed', 'Completed')
+        ('shipped', 'Shipped'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
     shipping_address = models.ForeignKey('customer.ShippingAddress', on_delete=models.CASCADE, blank=True, null=True)
-    product = models.ForeignKey('main.Product', on_delete=models.CASCADE, blank=True, null=True)
-    count_product = models.IntegerField(default=1)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
     created_at = models.DateTimeField(default=timezone.now)
+    # Totals of the line items, computed once at checkout
+    item_count = models.IntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        # Keyset pagination of a user's order history, optionally by status
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'status', 'id']),
+        ]
+
+
+class OrderItem(models.Model):
+    """A product of an order with its price and discount as they were at checkout."""
+    order = models.ForeignKey('main.Order', on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey('main.Product', on_delete=models.SET_NULL, blank=True, null=True)
+    product_name = models.CharField(max_length=100)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    discount_percentage = models.FloatField(default=0)
+    quantity = models.IntegerField()
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+class OrderStatusEvent(models.Model):
+    """One status transition of an order, kept for the notification task (``main.tasks``)."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(blank=True, null=True)
 
 
 class UserWallet(models.Model):
+    """Balance snapshot of the wallet ledger, kept current by ``main.wallets``."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
-    cash = models.FloatField(default=10000)
+    cash = models.DecimalField(max_digits=12, decimal_places=2, default=10000)
     created_at = models.DateTimeField(default=datetime.datetime.now)
 
 
+class WalletTransaction(models.Model):
+    """Append-only wallet ledger; the amounts of a user's entries add up to ``UserWallet.cash``."""
+    KIND_CHOICES = (
+        ('opening', 'Opening balance'),
+        ('debit', 'Debit'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_wallet_idempotency_key'),
+        ]
+
+
 class ReviewModel(models.Model):
     user_id = models.ForeignKey('auth.User', on_delete=models.CASCADE, blank=True, null=True)
     product_id = models.ForeignKey('main.Product', on_delete=models.CASCADE, blank=True, null=True)
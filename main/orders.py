@@ -0,0 +1,109 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from kombu.exceptions import OperationalError
+
+from .models import Order, OrderStatusEvent
+
+logger = logging.getLogger(__name__)
+
+# Status -> statuses an order may move to from it
+ORDER_TRANSITIONS = {
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('completed',),
+    'completed': (),
+    'cancelled': (),
+}
+
+# Orders that never turn into spend
+UNPAID_STATUSES = ('cancelled',)
+
+
+class OrderTransitionError(Exception):
+    pass
+
+
+class UnknownOrderStatusError(OrderTransitionError):
+    def __init__(self, to_status):
+        super().__init__(f'Unknown order status: {to_status}')
+
+
+def source_statuses(to_status):
+    """Statuses from which an order may move to ``to_status``."""
+    if to_status not in ORDER_TRANSITIONS:
+        raise UnknownOrderStatusError(to_status)
+    return [status for status, targets in ORDER_TRANSITIONS.items() if to_status in targets]
+
+
+def transition_orders(orders, to_status, batch_size=None):
+    """
+    Move every order of the ``orders`` queryset that may reach
+    ``to_status`` there and return the ids of the orders moved; orders in
+    any other status are left alone.
+
+    Orders are processed in id-ordered batches of ``batch_size``, each in
+    its own transaction: the batch is locked and its current statuses read
+    with one ``SELECT ... FOR UPDATE``, moved with one ``UPDATE`` and its
+    transitions recorded with one ``INSERT`` of ``OrderStatusEvent`` rows.
+    The notification task for a batch is queued once it commits.
+    """
+    batch_size = batch_size or settings.ORDER_TRANSITION_BATCH_SIZE
+    sources = source_statuses(to_status)
+    candidates = orders.filter(status__in=sources).order_by('id').values_list('id', flat=True).distinct()
+
+    moved = []
+    last_id = 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        with transaction.atomic():
+            current = list(
+                Order.objects.select_for_update().filter(id__in=ids, status__in=sources)
+                .order_by('id').values_list('id', 'status')
+            )
+            if not current:
+                continue
+            Order.objects.filter(id__in=[order_id for order_id, _ in current]).update(status=to_status)
+            events = OrderStatusEvent.objects.bulk_create([
+                OrderStatusEvent(order_id=order_id, from_status=from_status, to_status=to_status)
+                for order_id, from_status in current
+            ])
+            event_ids = [event.id for event in events]
+            transaction.on_commit(lambda event_ids=event_ids: queue_notifications(event_ids))
+        moved += [order_id for order_id, _ in current]
+    return moved
+
+
+def queue_notifications(event_ids):
+    """
+    Queue the notification of committed transitions. A broker outage must
+    not fail the remaining batches: the events stay unnotified in
+    ``OrderStatusEvent`` and can be sent again from there.
+    """
+    from .tasks import notify_order_status_changes
+
+    try:
+        notify_order_status_changes.apply_async((event_ids,), retry=False)
+    except OperationalError:
+        logger.exception('Could not queue notifications of order status events %s', event_ids)
+
+
+def order_summary(user_id):
+    """
+    Order count per status, lifetime spend and the date of the last order
+    of a user, in one aggregate query over the user's orders.
+    """
+    aggregates = {status: Count('id', filter=Q(status=status)) for status in ORDER_TRANSITIONS}
+    summary = Order.objects.filter(user_id=user_id).aggregate(
+        order_count=Count('id'),
+        lifetime_spend=Sum('total', filter=~Q(status__in=UNPAID_STATUSES), default=0),
+        last_order_at=Max('created_at'),
+        **aggregates,
+    )
+    summary['by_status'] = {status: summary.pop(status) for status in ORDER_TRANSITIONS}
+    return summary
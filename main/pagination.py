@@ -0,0 +1,202 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from redis import RedisError
+from rest_framework.utils.urls import replace_query_param
+
+from .leaderboards import get_leaderboard
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite, unique sort key such as
+    ``('-sold_quantity', '-id')``.
+
+    The cursor stores the sort values of the last row of the page, and the
+    next page is fetched with a ``WHERE (a, b) < (x, y)`` style filter, so a
+    deep page costs the same index range scan as the first one.
+    Views pick the sort key with a ``keyset_ordering`` attribute or a
+    ``get_keyset_ordering()`` method; the last field must be unique.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = settings.PRODUCT_PAGE_SIZE
+    max_page_size = settings.PRODUCT_MAX_PAGE_SIZE
+    ordering = ('-id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering())
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_position_filter(self, position):
+        """
+        Expand ``(f1, f2, ...) > (v1, v2, ...)`` into
+        ``f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...`` honouring each direction.
+        """
+        condition = Q()
+        equal = Q()
+        for order, value in zip(self.ordering, position):
+            attr = order.lstrip('-')
+            lookup = '__lt' if order.startswith('-') else '__gt'
+            condition |= equal & Q(**{attr + lookup: value})
+            equal &= Q(**{attr: value})
+        return condition
+
+    def get_position(self, item):
+        position = []
+        for order in self.ordering:
+            attr = order.lstrip('-')
+            value = item[attr] if isinstance(item, dict) else getattr(item, attr)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def encode_cursor(self, position):
+        encoded = b64encode(json.dumps(position, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            position = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(order.lstrip('-')).to_python(value)
+                for order, value in zip(self.ordering, position)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+
+class LeaderboardPagination(KeysetPagination):
+    """
+    Top sellers read from the Redis leaderboard by rank, hydrating only the
+    products of the page. Views return ``(category_id, min_sold)`` from
+    ``get_leaderboard_params()``, or ``None`` when the request needs the
+    database (extra filters), in which case the keyset pagination is used.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        leaderboard = get_leaderboard()
+        params = view.get_leaderboard_params() if leaderboard is not None else None
+        self.by_rank = params is not None
+        if not self.by_rank:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        category_id, min_sold = params
+        offset = self.decode_rank(request)
+
+        try:
+            product_ids = leaderboard.top(category_id, offset, self.page_size + 1, min_sold=min_sold)
+            if product_ids is None:
+                leaderboard.request_rebuild()
+        except RedisError:
+            product_ids = None
+        if product_ids is None:
+            self.by_rank = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.has_next = len(product_ids) > self.page_size
+        product_ids = product_ids[:self.page_size]
+        products = {
+            product['id'] if isinstance(product, dict) else product.pk: product
+            for product in queryset.filter(pk__in=product_ids)
+        }
+        self.page = [products[product_id] for product_id in product_ids if product_id in products]
+        self.next_rank = offset + self.page_size
+        return self.page
+
+    def get_next_link(self):
+        if not self.by_rank:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return self.encode_cursor([self.next_rank])
+
+    def decode_rank(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return 0
+
+        try:
+            (rank,) = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            return _positive_int(rank)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+
+from .cache import get_versions, bump_version
+from .models import Product, ProductSizeColor, File, ReviewModel, LikeModel
+from .serializers import ProductListSerializer
+
+# Shared reference data embedded in the page; their versions are part of the key
+PRODUCT_DETAIL_NAMESPACES = ('category', 'size', 'color')
+
+
+def product_detail_namespace(product_id):
+    return f'product-detail.{product_id}'
+
+
+def invalidate_product_detail(product_id):
+    if product_id is not None:
+        bump_version(product_detail_namespace(product_id))
+
+
+def product_detail_queryset():
+    """
+    The product page in three queries: the product with its category and
+    review/like summary (correlated subqueries, so no join fan-out), its
+    variants with sizes and colors, and its files.
+    """
+    reviews = ReviewModel.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+    likes = LikeModel.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+    return ProductListSerializer.setup_eager_loading(Product.objects.all()).annotate(
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0,
+                              output_field=IntegerField()),
+        review_average=Subquery(reviews.annotate(average=Avg('star')).values('average')),
+        like_count=Coalesce(Subquery(likes.annotate(total=Count('id')).values('total')), 0,
+                            output_field=IntegerField()),
+    ).prefetch_related(
+        Prefetch('productsizecolor_set',
+                 queryset=ProductSizeColor.objects.select_related('size', 'color').order_by('id')),
+        Prefetch('file_set', queryset=File.objects.order_by('id')),
+    )
+
+
+def availability_matrix(variants):
+    """Sizes and colors of the variants plus one row of booleans per size, one column per color."""
+    sizes, colors, available = {}, {}, set()
+    for variant in variants:
+        if variant.size is not None:
+            sizes[variant.size.id] = variant.size.name
+        if variant.color is not None:
+            colors[variant.color.id] = variant.color.name
+        if variant.size is not None and variant.color is not None:
+            available.add((variant.size.id, variant.color.id))
+
+    size_ids, color_ids = sorted(sizes), sorted(colors)
+    return {
+        'sizes': [{'id': size_id, 'name': sizes[size_id]} for size_id in size_ids],
+        'colors': [{'id': color_id, 'name': colors[color_id]} for color_id in color_ids],
+        'availability': [[(size_id, color_id) in available for color_id in color_ids] for size_id in size_ids],
+    }
+
+
+def build_product_detail(product_id):
+    product = product_detail_queryset().filter(pk=product_id).first()
+    if product is None:
+        return None
+
+    return {
+        'product': dict(ProductListSerializer(product).data),
+        'variants': availability_matrix(product.productsizecolor_set.all()),
+        'files': [
+            {'hash': file.hash, 'url': file.file.url if file.file else None}
+            for file in product.file_set.all()
+        ],
+        'reviews': {
+            'count': product.review_count,
+            'average': None if product.review_average is None else round(product.review_average, 2),
+            'likes': product.like_count,
+        },
+    }
+
+
+def get_product_detail(product_id):
+    """
+    The cached product page, or ``None`` for an unknown product. The key
+    holds a per-product version, bumped by the write receivers of the
+    product, its variants, files, reviews and likes, and the category, size
+    and color versions.
+    """
+    namespaces = PRODUCT_DETAIL_NAMESPACES + (product_detail_namespace(product_id),)
+    versions = '.'.join(str(version) for version in get_versions(namespaces))
+    key = f'product-detail:{product_id}:{versions}'
+    data = cache.get(key)
+    if data is None:
+        data = build_product_detail(product_id)
+        if data is not None:
+            cache.set(key, data, timeout=settings.PRODUCT_DETAIL_CACHE_TIMEOUT)
+    return data
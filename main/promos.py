@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import TwoTierCache
+from .models import PromoCode
+
+# Code -> metadata, or False for unknown codes so misses are cached too
+promo_code_cache = TwoTierCache('promo-code', timeout=settings.PROMO_CODE_CACHE_TIMEOUT)
+
+
+class PromoCodeError(Exception):
+    pass
+
+
+class PromoCodeNotFoundError(PromoCodeError):
+    def __init__(self):
+        super().__init__('PromoCode not found')
+
+
+class PromoCodeNotActiveError(PromoCodeError):
+    def __init__(self):
+        super().__init__('PromoCode is not active yet')
+
+
+class PromoCodeExpiredError(PromoCodeError):
+    def __init__(self):
+        super().__init__('PromoCode expired')
+
+
+class PromoCodeUsedUpError(PromoCodeError):
+    def __init__(self):
+        super().__init__('PromoCode usage limit reached')
+
+
+def load_promo_code(code):
+    promo_code = PromoCode.objects.filter(code=code).values(
+        'id', 'code', 'discount', 'start_date', 'end_date', 'max_usage', 'current_usage'
+    ).first()
+    return promo_code or False
+
+
+def validate_promo_code(code):
+    """
+    Metadata of a usable code from the short-lived cache, without touching
+    the database on a hit. The usage count may be up to
+    ``PROMO_CODE_CACHE_TIMEOUT`` seconds old; only ``redeem_promo_code``
+    is authoritative.
+    """
+    promo_code = promo_code_cache.get_or_set(code, lambda: load_promo_code(code))
+    if not promo_code:
+        raise PromoCodeNotFoundError()
+    now = timezone.now()
+    if promo_code['start_date'] > now:
+        raise PromoCodeNotActiveError()
+    if promo_code['end_date'] < now:
+        raise PromoCodeExpiredError()
+    if promo_code['current_usage'] >= promo_code['max_usage']:
+        raise PromoCodeUsedUpError()
+    return promo_code
+
+
+def redeem_promo_code(code):
+    """
+    Use the code once and return its metadata. Codes that fail validation
+    are rejected from the cache; the rest are counted by one conditional
+    UPDATE that never takes ``current_usage`` past ``max_usage``, however
+    many requests race for the last use. A failed redemption drops the
+    cached metadata so validation stops offering a used-up code.
+    """
+    promo_code = validate_promo_code(code)
+    if not PromoCode(pk=promo_code['id']).use():
+        promo_code_cache.invalidate()
+        raise PromoCodeUsedUpError()
+    return promo_code
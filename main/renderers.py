@@ -0,0 +1,25 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` backed by orjson for payloads made of plain Python types
+    (see ``main.fast_rendering``). The output matches DRF's compact UTF-8
+    rendering byte for byte, except that floats in exponent notation are
+    written as ``1e16`` instead of ``1e+16``. Falls back to DRF's renderer
+    when orjson is not installed or the payload has other types.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
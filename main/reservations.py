@@ -0,0 +1,239 @@
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .models import Product
+from .redis_store import get_redis
+
+# KEYS: the expiry set, then the stock counter and holds hash of every product
+# ARGV: user id, expiry timestamp, then per product its id, the count to hold
+#       and its database quantity ('' when not read yet)
+# The counts replace the user's holds on these products, 0 releasing one.
+# Returns {'missing', i, ...} when the stock counter of product i has to be
+# loaded first, {'short', i, available, ...} when product i cannot cover its
+# new count (nothing is changed then), or {} once every hold is taken.
+HOLD = """
+local user, expires_at = ARGV[1], ARGV[2]
+local products = (#KEYS - 1) / 2
+local deltas, missing, short = {}, {'missing'}, {'short'}
+for i = 1, products do
+    local stock_key, holds_key = KEYS[2 * i], KEYS[2 * i + 1]
+    local count = tonumber(ARGV[3 * i + 1])
+    deltas[i] = count - tonumber(redis.call('hget', holds_key, user) or '0')
+    if deltas[i] > 0 and redis.call('exists', stock_key) == 0 then
+        local quantity = ARGV[3 * i + 2]
+        if quantity == '' then
+            table.insert(missing, i)
+        else
+            local holding = 0
+            for _, value in ipairs(redis.call('hvals', holds_key)) do
+                holding = holding + tonumber(value)
+            end
+            redis.call('set', stock_key, tonumber(quantity) - holding)
+        end
+    end
+end
+if #missing > 1 then
+    return missing
+end
+for i = 1, products do
+    if deltas[i] > 0 then
+        local available = tonumber(redis.call('get', KEYS[2 * i]))
+        if available < deltas[i] then
+            table.insert(short, i)
+            table.insert(short, available + tonumber(ARGV[3 * i + 1]) - deltas[i])
+        end
+    end
+end
+if #short > 1 then
+    return short
+end
+for i = 1, products do
+    local stock_key, holds_key = KEYS[2 * i], KEYS[2 * i + 1]
+    local member = ARGV[3 * i] .. ':' .. user
+    if deltas[i] ~= 0 and redis.call('exists', stock_key) == 1 then
+        redis.call('decrby', stock_key, deltas[i])
+    end
+    if tonumber(ARGV[3 * i + 1]) > 0 then
+        redis.call('hset', holds_key, user, ARGV[3 * i + 1])
+        redis.call('zadd', KEYS[1], expires_at, member)
+    else
+        redis.call('hdel', holds_key, user)
+        redis.call('zrem', KEYS[1], member)
+    end
+end
+return {}
+"""
+
+# KEYS: the expiry set, then the holds hash of every product
+# ARGV: user id, current timestamp, then per product its id and count
+# Takes the user's holds as sold (their units already left the stock
+# counters) only if every one is live and matches its count; returns 1 then
+# and 0, changing nothing, otherwise.
+CONSUME = """
+local user, now = ARGV[1], tonumber(ARGV[2])
+for i = 2, #KEYS do
+    local member = ARGV[2 * i - 1] .. ':' .. user
+    local expires_at = redis.call('zscore', KEYS[1], member)
+    if redis.call('hget', KEYS[i], user) ~= ARGV[2 * i] or not expires_at or tonumber(expires_at) < now then
+        return 0
+    end
+end
+for i = 2, #KEYS do
+    redis.call('hdel', KEYS[i], user)
+    redis.call('zrem', KEYS[1], ARGV[2 * i - 1] .. ':' .. user)
+end
+return 1
+"""
+
+# KEYS: the expiry set
+# ARGV: current timestamp, batch size, stock counter and holds key prefixes
+# Returns up to a batch of expired holds to their stock counters; returns
+# the number released.
+SWEEP = """
+local members = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'limit', 0, tonumber(ARGV[2]))
+for _, member in ipairs(members) do
+    local product, user = string.match(member, '^(%d+):(%d+)$')
+    local holds_key, stock_key = ARGV[4] .. product, ARGV[3] .. product
+    local held = redis.call('hget', holds_key, user)
+    if held and redis.call('exists', stock_key) == 1 then
+        redis.call('incrby', stock_key, held)
+    end
+    redis.call('hdel', holds_key, user)
+    redis.call('zrem', KEYS[1], member)
+end
+return #members
+"""
+
+
+class UnknownProductsError(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f'Unknown products: {", ".join(map(str, product_ids))}')
+        self.product_ids = product_ids
+
+
+class OutOfStockError(Exception):
+    def __init__(self, shortages):
+        super().__init__('Not enough products in stock!')
+        # [{'product_id', 'requested', 'available'}]
+        self.shortages = shortages
+
+
+class StockReservations:
+    """
+    Time-boxed holds on product stock taken while products sit in carts.
+
+    Each product has a Redis counter of the units neither sold nor held,
+    loaded once from ``Product.quantity`` minus the live holds, and a hash
+    of the units held per user; a sorted set orders all holds by expiry.
+    Holds are taken, consumed and released by Lua scripts, so each change
+    is atomic across every product it touches and contended stock is
+    settled in Redis instead of on the ``Product`` row.
+
+    Holds are best effort: when Redis fails the cart works without them
+    and checkout falls back to locking the products.
+    """
+    stock_key_prefix = 'stock:'
+    holds_key_prefix = 'stock-holds:'
+    expiry_key = 'stock-holds'
+
+    def __init__(self, client):
+        self.client = client
+
+    def stock_key(self, product_id):
+        return f'{self.stock_key_prefix}{product_id}'
+
+    def holds_key(self, product_id):
+        return f'{self.holds_key_prefix}{product_id}'
+
+    def hold(self, user_id, counts):
+        """
+        Make the user's holds on the products of ``{product_id: count}``
+        match the counts for ``STOCK_HOLD_TIMEOUT`` seconds, or raise
+        ``OutOfStockError`` (``UnknownProductsError`` for ids without a
+        product) leaving every hold as it was.
+        """
+        if not counts:
+            return
+        product_ids = sorted(counts)
+        keys = [self.expiry_key]
+        for product_id in product_ids:
+            keys += [self.stock_key(product_id), self.holds_key(product_id)]
+        quantities = {}
+
+        try:
+            while True:
+                args = [user_id, time.time() + settings.STOCK_HOLD_TIMEOUT]
+                for product_id in product_ids:
+                    args += [product_id, counts[product_id], quantities.get(product_id, '')]
+                result = self.client.eval(HOLD, len(keys), *keys, *args)
+                if not result or result[0] != b'missing':
+                    break
+                missing = [product_ids[int(index) - 1] for index in result[1:]]
+                loaded = dict(Product.objects.filter(id__in=missing).values_list('id', 'quantity'))
+                unknown = sorted(set(missing) - set(loaded))
+                if unknown:
+                    # No counter is written for them, the script stops before any change
+                    raise UnknownProductsError(unknown)
+                quantities.update(loaded)
+        except RedisError:
+            return
+
+        if result:
+            raise OutOfStockError([
+                {'product_id': product_ids[int(index) - 1], 'requested': counts[product_ids[int(index) - 1]],
+                 'available': max(int(available), 0)}
+                for index, available in zip(result[1::2], result[2::2])
+            ])
+
+    def release(self, user_id, product_ids):
+        """Give the user's held units of ``product_ids`` back to the stock."""
+        self.hold(user_id, {product_id: 0 for product_id in product_ids})
+
+    def consume(self, user_id, counts):
+        """
+        Turn the user's holds into sales if every product of
+        ``{product_id: count}`` is held for exactly that count; returns
+        whether it did.
+        """
+        product_ids = sorted(counts)
+        args = [user_id, time.time()]
+        for product_id in product_ids:
+            args += [product_id, counts[product_id]]
+        keys = [self.expiry_key] + [self.holds_key(product_id) for product_id in product_ids]
+        try:
+            return bool(self.client.eval(CONSUME, len(keys), *keys, *args))
+        except RedisError:
+            return False
+
+    def forget(self, product_ids):
+        """
+        Drop the stock counters of products whose ``quantity`` changed
+        outside of holds; they are reloaded on the next hold.
+        """
+        if not product_ids:
+            return
+        try:
+            self.client.delete(*[self.stock_key(product_id) for product_id in product_ids])
+        except RedisError:
+            pass
+
+    def sweep(self, batch_size=None):
+        """Release every expired hold, a batch per script call; returns how many were released."""
+        batch_size = batch_size or settings.STOCK_HOLD_SWEEP_BATCH_SIZE
+        released = 0
+        while True:
+            count = self.client.eval(SWEEP, 1, self.expiry_key, time.time(), batch_size,
+                                     self.stock_key_prefix, self.holds_key_prefix)
+            released += count
+            if count < batch_size:
+                return released
+
+
+def get_reservations():
+    """Stock holds backed by Redis, or ``None`` when Redis is not configured."""
+    client = get_redis()
+    if client is None:
+        return None
+    return StockReservations(client)
@@ -0,0 +1,182 @@
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Relative weight of a term found in the product name vs. its description,
+# mirroring the 'A' / 'B' weights of the Postgres search vector.
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class PostgresProductSearch:
+    """
+    Ranked search over ``Product.search_vector`` (a weighted tsvector kept up
+    to date by a trigger and indexed with GIN) combined with trigram
+    similarity on the name, which also catches typos.
+    """
+    config = 'english'
+
+    def search(self, queryset, query, limit):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # Every term is matched as a prefix so "sneak" finds "sneakers".
+        ts_query = SearchQuery(' & '.join(f'{term}:*' for term in terms), config=self.config, search_type='raw')
+        queryset = queryset.annotate(
+            rank=SearchRank(F('search_vector'), ts_query) + TrigramSimilarity('name', query)
+        ).filter(
+            Q(search_vector=ts_query) | Q(name__trigram_similar=query)
+        ).order_by('-rank', '-id')
+        return list(queryset[:limit])
+
+    def rebuild(self):
+        pass
+
+    def update(self, product):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+
+class InvertedIndexProductSearch:
+    """
+    In-process inverted index used when the database is not Postgres
+    (tests, local sqlite). The index is built lazily on the first search and
+    kept current by the Product signals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._documents = {}
+        self._terms = []
+        self._terms_dirty = False
+
+    def _document_terms(self, name, description):
+        weights = defaultdict(float)
+        for term in tokenize(description):
+            weights[term] += DESCRIPTION_WEIGHT
+        for term in tokenize(name):
+            weights[term] += NAME_WEIGHT
+        return weights
+
+    def _add(self, product_id, name, description):
+        weights = self._document_terms(name, description)
+        self._documents[product_id] = tuple(weights)
+        for term, weight in weights.items():
+            if term not in self._postings:
+                self._terms_dirty = True
+            self._postings.setdefault(term, {})[product_id] = weight
+
+    def _discard(self, product_id):
+        for term in self._documents.pop(product_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._terms_dirty = True
+
+    def _ensure_built(self):
+        if self._postings is not None:
+            return
+        self._postings = {}
+        for product_id, name, description in Product.objects.values_list('id', 'name', 'description').iterator():
+            self._add(product_id, name, description)
+        self._terms_dirty = True
+
+    def _expand(self, prefix):
+        if self._terms_dirty:
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+        start = bisect_left(self._terms, prefix)
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def rank(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            self._ensure_built()
+            total = len(self._documents) or 1
+            scores = None
+            for prefix in terms:
+                matches = defaultdict(float)
+                for term in self._expand(prefix):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for product_id, weight in postings.items():
+                        matches[product_id] = max(matches[product_id], weight * idf)
+                if scores is None:
+                    scores = matches
+                else:
+                    # All query terms have to match, like '&' in a tsquery
+                    scores = {product_id: score + matches[product_id]
+                              for product_id, score in scores.items() if product_id in matches}
+                if not scores:
+                    return []
+
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    def search(self, queryset, query, limit):
+        ranked = self.rank(query)
+        if not ranked:
+            return []
+
+        scores = dict(ranked)
+        products = list(queryset.filter(id__in=scores))
+        products.sort(key=lambda product: (-scores[product.id], -product.id))
+        return products[:limit]
+
+    def rebuild(self):
+        with self._lock:
+            self._postings = None
+            self._documents = {}
+            self._ensure_built()
+
+    def update(self, product):
+        with self._lock:
+            if self._postings is not None:
+                self._discard(product.id)
+                self._add(product.id, product.name, product.description)
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._postings is not None:
+                self._discard(product_id)
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        name = settings.PRODUCT_SEARCH_BACKEND or connection.vendor
+        if name == 'postgresql':
+            _backend = PostgresProductSearch()
+        else:
+            _backend = InvertedIndexProductSearch()
+    return _backend
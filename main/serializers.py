@@ -1,9 +1,55 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.core.validators import MaxValueValidator
 from rest_framework import serializers
-from .models import Order, UserWallet
+
+from customer.discounts import get_active_discounts
+from .pricing import PricingEngine, promo_percentage
+from .models import Order, OrderItem, UserWallet
 from .models import LikeModel
 from .models import ReviewModel
-from .models import Product, Size, Category, File, Color, ProductSizeColor, ShoppingCart, PromoCode
+from .models import Product, Size, Category, File, Color, ProductSizeColor, PromoCode
+
+
+class EagerLoadingMixin:
+    """
+    Declares the relations a serializer reads so list views can load them
+    up front instead of issuing one query per row.
+
+    Relations of nested serializers that use the mixin are followed
+    automatically, e.g. ``GetProductSizeColorSerializer`` selecting ``product``
+    also selects ``product__category`` because ``ProductListSerializer`` does.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def get_related_lookups(cls, prefix=''):
+        select_related = [prefix + name for name in cls.select_related_fields]
+        prefetch_related = [prefix + name for name in cls.prefetch_related_fields]
+
+        for name, field in cls._declared_fields.items():
+            nested = getattr(field, 'child', field)
+            if not isinstance(nested, EagerLoadingMixin):
+                continue
+            source = field.source or name
+            if source in cls.select_related_fields:
+                nested_select, nested_prefetch = nested.get_related_lookups(prefix + source + '__')
+                select_related += nested_select
+                prefetch_related += nested_prefetch
+            elif source in cls.prefetch_related_fields:
+                prefetch_related += sum(nested.get_related_lookups(prefix + source + '__'), [])
+        return select_related, prefetch_related
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related, prefetch_related = cls.get_related_lookups()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
 
 
 class SizeSerializer(serializers.ModelSerializer):
@@ -48,18 +94,37 @@ class CreateProductSerializer(serializers.ModelSerializer):
         fields = ('name', 'description', 'price', 'category', 'quantity')
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class PricedListSerializer(serializers.ListSerializer):
+    """
+    Adds the ``effective_price`` of every product of the list in one
+    vectorized pass (``main.pricing``), including the discount of a
+    ``promo_code`` query parameter.
+    """
+
+    def to_representation(self, data):
+        return self.finalize_rows(super().to_representation(data), self.context)
+
+    @staticmethod
+    def finalize_rows(rows, context):
+        engine = PricingEngine.for_index(get_active_discounts())
+        return engine.price_rows(rows, promo_percentage(context.get('request')))
+
+
+class ProductListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     category = CategorySerializer()
+    select_related_fields = ('category',)
 
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('search_vector',)
+        list_serializer_class = PricedListSerializer
 
 
-class GetProductSizeColorSerializer(serializers.ModelSerializer):
+class GetProductSizeColorSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     size = SizeSerializer()
     color = ColorSerializer()
     product = ProductListSerializer()
+    select_related_fields = ('size', 'color', 'product')
 
     class Meta:
         model = ProductSizeColor
@@ -69,16 +134,18 @@ class GetProductSizeColorSerializer(serializers.ModelSerializer):
         return File.objects.create(**validated_data)
 
 
-class GetProductSizeSerializer(serializers.ModelSerializer):
+class GetProductSizeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     size = SizeSerializer()
+    select_related_fields = ('size',)
 
     class Meta:
         model = ProductSizeColor
         fields = ('size',)
 
 
-class GetSizeColorSerializer(serializers.ModelSerializer):
+class GetSizeColorSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     color = ColorSerializer()
+    select_related_fields = ('color',)
 
     class Meta:
         model = ProductSizeColor
@@ -91,10 +158,21 @@ class ProductAddSizeColorSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class AddToShoppingCartSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ShoppingCart
-        fields = ('product_id', 'count_product')
+class AddToShoppingCartSerializer(serializers.Serializer):
+    # Plain ids: the cart store relies on the database constraints rather
+    # than looking the product up first
+    product_id = serializers.IntegerField(min_value=1)
+    count_product = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=('add', 'set', 'remove'))
+    product_id = serializers.IntegerField(min_value=1)
+    count_product = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = serializers.ListField(child=CartOperationSerializer(), min_length=1, max_length=100)
 
 
 sort_by_choices = (
@@ -108,6 +186,39 @@ class FilterQuerySerializer(serializers.Serializer):
     end_price = serializers.IntegerField(required=False)
     sort_by = serializers.ChoiceField(choices=sort_by_choices)
     rate = serializers.IntegerField(validators=[MaxValueValidator(5)])
+    facets = serializers.BooleanField(required=False)
+
+
+class ProductSearchQuerySerializer(serializers.Serializer):
+    query = serializers.CharField(max_length=255)
+    category_id = serializers.IntegerField(required=False)
+    start_price = serializers.FloatField(required=False)
+    end_price = serializers.FloatField(required=False)
+    rate = serializers.IntegerField(required=False, validators=[MaxValueValidator(5)])
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=settings.PRODUCT_MAX_PAGE_SIZE)
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    price = serializers.FloatField(min_value=0)
+    rate = serializers.IntegerField(required=False, default=0, min_value=0, validators=[MaxValueValidator(5)])
+    quantity = serializers.IntegerField(required=False, default=0, min_value=0)
+    sold_quantity = serializers.IntegerField(required=False, default=0, min_value=0)
+    category_id = serializers.IntegerField()
+    sizes = serializers.ListField(child=serializers.CharField(max_length=10), required=False, default=list)
+    colors = serializers.ListField(child=serializers.CharField(max_length=20), required=False, default=list)
+
+
+class ProductImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=('csv', 'jsonl'), required=False)
+    batch_size = serializers.IntegerField(required=False, min_value=1, max_value=10000)
+
+
+class ProductExportQuerySerializer(serializers.Serializer):
+    after_id = serializers.IntegerField(required=False, min_value=0)
+    compression = serializers.ChoiceField(choices=('gzip',), required=False)
 
 
 class PromoCodeSerializer(serializers.ModelSerializer):
@@ -116,37 +227,65 @@ class PromoCodeSerializer(serializers.ModelSerializer):
         fields = ('discount',)
 
 
+class RedeemPromoCodeSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=20)
+
+
 class QuerySerializer(serializers.Serializer):
     query = serializers.CharField(max_length=255)
 
 
-class CreateOrderSerializer(serializers.ModelSerializer):
-    product = ProductListSerializer()
-
+class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Order
-        fields = ('product', 'status', 'count_product')
+        model = OrderItem
+        fields = ('product', 'product_name', 'unit_price', 'discount_percentage', 'quantity', 'total')
 
 
 class GetOrderSerializer(serializers.ModelSerializer):
-    product = ProductListSerializer()
-
+    """The order header only; the list endpoints never touch the line items."""
     class Meta:
         model = Order
-        fields = '__all__'
+        fields = ('id', 'status', 'shipping_address', 'item_count', 'subtotal', 'discount_total', 'total',
+                  'created_at')
 
 
-class UpdateOrderSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Order
-        fields = ('product',)
+class OrderHistoryQuerySerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+
+
+class OrderSummarySerializer(serializers.Serializer):
+    order_count = serializers.IntegerField()
+    by_status = serializers.DictField(child=serializers.IntegerField())
+    lifetime_spend = serializers.DecimalField(max_digits=14, decimal_places=2)
+    last_order_at = serializers.DateTimeField(allow_null=True)
+
+
+class OrderDetailSerializer(EagerLoadingMixin, GetOrderSerializer):
+    items = OrderItemSerializer(many=True)
+    prefetch_related_fields = ('items',)
+
+    class Meta(GetOrderSerializer.Meta):
+        fields = GetOrderSerializer.Meta.fields + ('items',)
+
+
+class UpdateOrderSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+
+
+class OrderStatusBatchSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=10000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
 
 
 class PaymentSerializer(serializers.Serializer):
-    cash = serializers.FloatField()
+    cash = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    # Retries with the same key are charged once; the Idempotency-Key header works too
+    idempotency_key = serializers.CharField(max_length=64, required=False)
 
 
 class UserWalletSerializer(serializers.ModelSerializer):
+    cash = serializers.DecimalField(max_digits=12, decimal_places=2, coerce_to_string=False, read_only=True)
+
     class Meta:
         model = UserWallet
         fields = ('cash', 'created_at')
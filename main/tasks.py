@@ -35,9 +35,76 @@ def send_email_reset(email, uidb64, token):
     return 'Done'
 
 
+@shared_task
+def rebuild_leaderboards():
+    from main.leaderboards import get_leaderboard
+
+    leaderboard = get_leaderboard()
+    if leaderboard is not None:
+        leaderboard.rebuild()
+    return 'Done'
+
+
+@shared_task
+def reconcile_category_counts():
+    from main.counters import reconcile_product_counts
+
+    return reconcile_product_counts()
+
+
+@shared_task
+def release_expired_stock_holds():
+    from main.reservations import get_reservations
+
+    reservations = get_reservations()
+    if reservations is None:
+        return 0
+    return reservations.sweep()
+
+
+# Queued from discount writes; nothing waits on its result
+@shared_task(ignore_result=True)
+def refresh_active_discounts():
+    from customer.discounts import refresh_active_discounts as refresh, claim_refresh
+
+    boundary = refresh()
+    if boundary is not None and claim_refresh(boundary):
+        refresh_active_discounts.apply_async(eta=boundary)
+    return 'Done'
+
+
 @shared_task
 def clear_temporary_files():
     temporary_directory = '/media/temporarily'
     for filename in os.listdir(temporary_directory):
         file_path = os.path.join(temporary_directory, filename)
         os.remove(file_path)
+
+
+@shared_task
+def import_products(path, report_path, file_format=None, batch_size=None):
+    from main.importers import import_products as run_import
+
+    return run_import(path, report_path, file_format=file_format, batch_size=batch_size)
+
+
+# Queued after order transitions commit; nothing waits on its result
+@shared_task(ignore_result=True)
+def notify_order_status_changes(event_ids):
+    from django.core.mail import send_mass_mail
+    from django.utils import timezone
+
+    from main.models import OrderStatusEvent
+
+    events = OrderStatusEvent.objects.filter(id__in=event_ids, notified_at__isnull=True).select_related('order__user')
+    messages = [
+        (f'Order #{event.order_id} is {event.get_to_status_display().lower()}',
+         f'Your order #{event.order_id} changed from {event.get_from_status_display().lower()} '
+         f'to {event.get_to_status_display().lower()}.',
+         'From OLX clone team',
+         [event.order.user.email])
+        for event in events if event.order.user is not None and event.order.user.email
+    ]
+    send_mass_mail(messages, fail_silently=True)
+    OrderStatusEvent.objects.filter(id__in=event_ids, notified_at__isnull=True).update(notified_at=timezone.now())
+    return 'Done'
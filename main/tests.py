@@ -1,3 +1,773 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import zlib
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from django.utils import timezone
+import fakeredis
+from rest_framework.test import APIClient
+
+from accounts.models import Role, UserRole
+from customer import urls as customer_urls
+from customer.discounts import get_active_discounts, ACTIVE_DISCOUNTS_KEY_PREFIX
+from customer.geo import get_geo_index
+from customer.models import (
+    Country, State, City, ShippingAddress,
+    Favorite, DiscountProduct, DiscountCategory
+)
+from main import redis_store, urls as main_urls
+from main.carts import get_cart_store
+from main.checkout import checkout, InsufficientStockError
+from main.counters import adjust_product_counts
+from main.exporters import export_products
+from main.importers import import_products
+from main.leaderboards import get_leaderboard, record_sales
+from main.orders import transition_orders, UnknownOrderStatusError
+from main.reservations import get_reservations, OutOfStockError
+from main.promos import validate_promo_code, redeem_promo_code, PromoCodeUsedUpError
+from main.search import get_search_backend
+from main.tasks import reconcile_category_counts
+from main.wallets import debit, InsufficientFundsError, IdempotencyKeyReusedError
+from main.models import (
+    Product, Category, Size, Color,
+    ProductSizeColor, File, ShoppingCart,
+    PromoCode, Order, OrderItem,
+    UserWallet, WalletTransaction, OrderStatusEvent
+)
+
+# Maximum number of queries each GET route may issue, independent of how
+# many rows it returns. ``None`` marks a route with a known per-row query.
+QUERY_BUDGETS = {
+    'main/import-products/<str:import_id>': 1,
+    'main/export-products': 4,
+    'main/product-detail/<int:pk>': 3,
+    'main/product-get-update-delete/<int:pk>': 2,
+    'main/category-get/<int:pk>': 1,
+    'main/search-category/': 2,
+    'main/search-products/': 1,
+    'main/color-get/<int:pk>': 1,
+    'main/size-get/<int:pk>': 1,
+    'main/get-product-sizes/<int:pk>': 1,
+    'main/get-product-color-by-size-id/': 1,
+    'main/get-products-by-category_id/<int:category_id>': 1,
+    'main/get-product-files/<int:pk>': 1,
+    'main/get-product-files/<str:hash_code>': 1,
+    'main/get-categories': 1,
+    'main/get-colors': 1,
+    'main/get-sizes': 1,
+    'main/get-products-by-all-categories/': 1,
+    'main/get-top-products-by-category-id/<int:category_id>': 1,
+    'main/get-new-arrivals-products': 1,
+    'main/get-popular-products': 1,
+    'main/get-shopping-cart-products': 1,
+    'main/filter': 1,
+    'main/promocode': 1,
+    'main/get-order': 1,
+    'main/get-order/summary': 1,
+    'main/get-order/<int:pk>': 2,
+    'main/user-wallet': 1,
+    'customer/favourites/': 2,
+    'customer/shipping_address/': 1,
+    'customer/geo/typeahead/': 0,
+    'customer/discount_category_list/': 4,
+    'customer/discount_product_list/': 4,
+}
+
+
+def get_routes():
+    for prefix, module in (('main/', main_urls), ('customer/', customer_urls)):
+        for pattern in module.urlpatterns:
+            if isinstance(pattern, URLPattern):
+                yield prefix + str(pattern.pattern), pattern
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every readable route in main/urls.py and customer/urls.py must stay
+    within its budget from QUERY_BUDGETS for a small and a large data set.
+    """
+    small = 2
+    large = 12
+
+    def setUp(self):
+        cache.clear()
+        get_search_backend().rebuild()
+        self.user = User.objects.create_user(username='budget', password='budget')
+        UserRole.objects.create(user=self.user, role=Role.objects.create(name='admin'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        country = Country.objects.create(name='Uzbekistan')
+        state = State.objects.create(state='Tashkent', country=country)
+        city = City.objects.create(city='Tashkent', state=state)
+        self.address = dict(user=self.user, phone_number='1', postal_code='1', street_address='1',
+                            house_number='1', state=state, city=city, country=country)
+        self.category = Category.objects.create(name='Shirts')
+        self.size = Size.objects.create(name='M')
+        self.color = Color.objects.create(name='Red')
+        now = timezone.now()
+        self.promo_code = PromoCode.objects.create(code='SALE', discount=10, end_date=now + timedelta(days=1),
+                                                   max_usage=1000)
+        self.order = Order.objects.create(user=self.user)
+        self.count = 0
+
+    def seed(self, total):
+        now = timezone.now()
+        while self.count < total:
+            self.count += 1
+            category = Category.objects.create(name=f'Category {self.count}')
+            product = Product.objects.create(name=f'Product {self.count}', description='', rate=4, sold_quantity=3,
+                                             price=self.count, category=self.category)
+            Product.objects.create(name=f'Other {self.count}', description='', price=1, category=category)
+            ProductSizeColor.objects.create(product=self.product, size=Size.objects.create(name=f'{self.count}'),
+                                            color=self.color)
+            ProductSizeColor.objects.create(product=self.product, size=self.size,
+                                            color=Color.objects.create(name=f'{self.count}'))
+            File(file=f'file/{self.count}.jpg', product=self.product).save()
+            ShoppingCart.objects.create(product_id=product, user_id=self.user)
+            OrderItem.objects.create(order=self.order, product=product, product_name=product.name, unit_price=1,
+                                     quantity=1, total=1)
+            Order.objects.create(user=self.user)
+            Favorite.objects.create(user=self.user, product=product)
+            PromoCode.objects.create(code=f'SALE{self.count}', discount=10, end_date=now + timedelta(days=1))
+            ShippingAddress.objects.create(**self.address)
+            DiscountProduct.objects.create(product=product, discount_percentage=10, start_time=now,
+                                           end_time=now + timedelta(days=1))
+            DiscountCategory.objects.create(category=category, discount_percentage=10, start_time=now,
+                                            end_time=now + timedelta(days=1))
+        # The refresh task keeps the active-discount index warm in production
+        get_active_discounts()
+        get_geo_index()
+
+    @property
+    def product(self):
+        return Product.objects.filter(category=self.category).order_by('id').first()
+
+    def get_url(self, route):
+        product = self.product
+        urls = {
+            'main/product-detail/<int:pk>': f'/main/product-detail/{product.id}',
+            'main/product-get-update-delete/<int:pk>': f'/main/product-get-update-delete/{product.id}',
+            'main/category-get/<int:pk>': f'/main/category-get/{self.category.id}',
+            'main/search-category/': '/main/search-category/?query=Cat',
+            'main/search-products/': f'/main/search-products/?query=prod&category_id={self.category.id}',
+            'main/color-get/<int:pk>': f'/main/color-get/{self.color.id}',
+            'main/size-get/<int:pk>': f'/main/size-get/{self.size.id}',
+            'main/get-product-sizes/<int:pk>': f'/main/get-product-sizes/{product.id}',
+            'main/get-product-color-by-size-id/':
+                f'/main/get-product-color-by-size-id/?product_id={product.id}&size_id={self.size.id}',
+            'main/get-products-by-category_id/<int:category_id>':
+                f'/main/get-products-by-category_id/{self.category.id}',
+            'main/get-product-files/<int:pk>': f'/main/get-product-files/{product.id}',
+            'main/get-product-files/<str:hash_code>':
+                f'/main/get-product-files/{File.objects.filter(product=product).first().hash}',
+            'main/get-top-products-by-category-id/<int:category_id>':
+                f'/main/get-top-products-by-category-id/{self.category.id}',
+            'main/filter': f'/main/filter?category_id={self.category.id}&rate=3',
+            'main/promocode': f'/main/promocode?query={self.promo_code.code}',
+            'main/get-order/<int:pk>': f'/main/get-order/{self.order.id}',
+            'customer/geo/typeahead/': '/customer/geo/typeahead/?query=tash',
+        }
+        return urls.get(route, '/' + route)
+
+    def count_queries(self, route):
+        url = self.get_url(route)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, f'{url} -> {response.status_code}')
+        return len(context.captured_queries)
+
+    def test_every_readable_route_has_a_budget(self):
+        readable = {route for route, pattern in get_routes() if hasattr(pattern.callback.view_class, 'get')}
+        self.assertEqual(readable, set(QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        routes = [route for route, budget in QUERY_BUDGETS.items() if budget is not None]
+
+        self.seed(self.small)
+        small = {route: self.count_queries(route) for route in routes}
+        self.seed(self.large)
+        large = {route: self.count_queries(route) for route in routes}
+
+        for route in routes:
+            with self.subTest(route=route):
+                self.assertLessEqual(large[route], QUERY_BUDGETS[route])
+                self.assertEqual(small[route], large[route], 'query count grows with the result size')
+
+
+class ActiveDiscountWindowTests(TestCase):
+    """The discount version, and with it every catalog ETag, moves on when a discount ends."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        now = timezone.now()
+        self.category = Category.objects.create(name='Shirts')
+        self.product = Product.objects.create(name='Shirt', description='', price=100, category=self.category)
+        self.discount = DiscountProduct.objects.create(product=self.product, discount_percentage=20,
+                                                       start_time=now - timedelta(hours=1),
+                                                       end_time=now + timedelta(hours=1))
+
+    def after_end(self):
+        return mock.patch('django.utils.timezone.now', return_value=self.discount.end_time + timedelta(seconds=1))
+
+    def test_index_drops_the_ended_discount_under_a_new_etag(self):
+        before = get_active_discounts()
+        self.assertEqual(before['product_percentages'], {self.product.id: 20})
+
+        with self.after_end():
+            after = get_active_discounts()
+        self.assertEqual(after['product_percentages'], {})
+        self.assertNotEqual(after['etag'], before['etag'])
+
+    def test_etag_changes_once_the_expired_index_is_gone(self):
+        response = self.client.get('/customer/discount_product_list/')
+        etag = response['ETag']
+        # The entry expires at the boundary, so the next read does not find it
+        cache.delete(ACTIVE_DISCOUNTS_KEY_PREFIX + etag.strip('"').split('.', 1)[1])
+
+        with self.after_end():
+            response = self.client.get('/customer/discount_product_list/', HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response.status_code, 304)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+def create_shipping_address(user):
+    country = Country.objects.create(name='Uzbekistan')
+    state = State.objects.create(state='Tashkent', country=country)
+    return ShippingAddress.objects.create(user=user, phone_number='1', postal_code='1', street_address='1',
+                                          house_number='1', state=state, country=country,
+                                          city=City.objects.create(city='Tashkent', state=state))
+
+
+class StockReservationTests(TestCase):
+    """Cart stock holds in (fake) Redis and the checkouts consuming them."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.addCleanup(setattr, redis_store, '_client', redis_store._client)
+        redis_store._client = self.redis
+        self.reservations = get_reservations()
+
+        self.user = User.objects.create_user(username='buyer', password='buyer')
+        self.other = User.objects.create_user(username='other', password='other')
+        self.product = Product.objects.create(name='Shirt', description='', price=10, quantity=5,
+                                              category=Category.objects.create(name='Shirts'))
+        create_shipping_address(self.user)
+
+    def available(self):
+        return int(self.redis.get(self.reservations.stock_key(self.product.id)))
+
+    def held(self, user):
+        held = self.redis.hget(self.reservations.holds_key(self.product.id), user.id)
+        return None if held is None else int(held)
+
+    def test_hold_and_release_move_the_stock_counter(self):
+        self.reservations.hold(self.user.id, {self.product.id: 2})
+        self.assertEqual((self.available(), self.held(self.user)), (3, 2))
+
+        self.reservations.hold(self.user.id, {self.product.id: 4})
+        self.assertEqual((self.available(), self.held(self.user)), (1, 4))
+
+        self.reservations.release(self.user.id, [self.product.id])
+        self.assertEqual((self.available(), self.held(self.user)), (5, None))
+
+    def test_hold_beyond_stock_is_rejected_unchanged(self):
+        self.reservations.hold(self.other.id, {self.product.id: 4})
+
+        with self.assertRaises(OutOfStockError) as raised:
+            self.reservations.hold(self.user.id, {self.product.id: 2})
+        self.assertEqual(raised.exception.shortages,
+                         [{'product_id': self.product.id, 'requested': 2, 'available': 1}])
+        self.assertEqual((self.available(), self.held(self.user)), (1, None))
+
+    def test_checkout_consumes_the_holds_and_takes_stock_once(self):
+        get_cart_store().add(self.user.id, self.product.id, 2)
+
+        order = checkout(self.user.id)
+
+        self.product.refresh_from_db()
+        self.assertEqual((order.item_count, self.product.quantity, self.product.sold_quantity), (2, 3, 2))
+        self.assertEqual((self.available(), self.held(self.user)), (3, None))
+
+    @override_settings(STOCK_HOLD_TIMEOUT=-1)
+    def test_checkout_with_an_expired_hold_falls_back_to_locking(self):
+        get_cart_store().add(self.user.id, self.product.id, 2)
+        self.assertFalse(self.reservations.consume(self.user.id, {self.product.id: 2}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.user.id)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+        # Reloaded from the new quantity on the next hold
+        self.assertFalse(self.redis.exists(self.reservations.stock_key(self.product.id)))
+
+    @override_settings(STOCK_HOLD_TIMEOUT=-1)
+    def test_sweep_returns_expired_holds_to_stock(self):
+        self.reservations.hold(self.user.id, {self.product.id: 2})
+        self.reservations.hold(self.other.id, {self.product.id: 1})
+        self.assertEqual(self.available(), 2)
+
+        self.assertEqual(self.reservations.sweep(), 2)
+        self.assertEqual((self.available(), self.held(self.user), self.held(self.other)), (5, None, None))
+        self.assertEqual(self.reservations.sweep(), 0)
+
+
+class WalletLedgerTests(TestCase):
+    """Debits through main.wallets keep the ledger and the balance snapshot in step."""
+
+    def setUp(self):
+        # The wallet is opened with its 10000 opening entry by the User receiver
+        self.user = User.objects.create_user(username='payer', password='payer')
+
+    def balance(self):
+        return UserWallet.objects.get(user=self.user).cash
+
+    def assertLedgerMatchesBalance(self):
+        ledger = WalletTransaction.objects.filter(user=self.user).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(ledger, self.balance())
+
+    def test_debit_lowers_the_balance_and_records_an_entry(self):
+        entry, replayed = debit(self.user.id, '2500.50', idempotency_key='order-1')
+
+        self.assertFalse(replayed)
+        self.assertEqual((entry.kind, entry.amount, entry.balance_after),
+                         ('debit', Decimal('-2500.50'), Decimal('7499.50')))
+        self.assertLedgerMatchesBalance()
+
+    def test_insufficient_funds_change_nothing(self):
+        debit(self.user.id, 9000)
+
+        with self.assertRaises(InsufficientFundsError):
+            debit(self.user.id, '1000.01')
+        self.assertEqual(self.balance(), Decimal('1000.00'))
+        self.assertEqual(WalletTransaction.objects.filter(user=self.user).count(), 2)
+        self.assertLedgerMatchesBalance()
+
+    def test_retry_with_the_same_key_is_replayed(self):
+        entry, _ = debit(self.user.id, 100, idempotency_key='order-1')
+
+        replay, replayed = debit(self.user.id, 100, idempotency_key='order-1')
+        self.assertTrue(replayed)
+        self.assertEqual(replay.id, entry.id)
+        self.assertEqual(self.balance(), Decimal('9900.00'))
+        self.assertLedgerMatchesBalance()
+
+    def test_key_reused_for_another_amount_is_rejected(self):
+        debit(self.user.id, 100, idempotency_key='order-1')
+
+        with self.assertRaises(IdempotencyKeyReusedError):
+            debit(self.user.id, 200, idempotency_key='order-1')
+        self.assertEqual(self.balance(), Decimal('9900.00'))
+
+    def test_payment_endpoint_answers_409_for_a_reused_key(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payment = {'cash': '100.00', 'idempotency_key': 'order-1'}
+
+        first = client.post('/main/payment', payment, format='json')
+        second = client.post('/main/payment', {**payment, 'cash': '150.00'}, format='json')
+        self.assertEqual((first.status_code, first.data['replayed']), (200, False))
+        self.assertEqual(second.status_code, 409)
+        self.assertLedgerMatchesBalance()
+
+
+class PromoCodeRedemptionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.promo_code = PromoCode.objects.create(code='SALE', discount=10, max_usage=2,
+                                                   end_date=timezone.now() + timedelta(days=1))
+
+    def test_redemption_stops_at_max_usage(self):
+        redeem_promo_code('SALE')
+        redeem_promo_code('SALE')
+
+        with self.assertRaises(PromoCodeUsedUpError):
+            redeem_promo_code('SALE')
+        self.promo_code.refresh_from_db()
+        self.assertEqual(self.promo_code.current_usage, 2)
+
+    def test_used_up_code_no_longer_validates(self):
+        # Cached as still usable before the redemptions
+        validate_promo_code('SALE')
+        for _ in range(2):
+            redeem_promo_code('SALE')
+
+        with self.assertRaises(PromoCodeUsedUpError):
+            redeem_promo_code('SALE')
+        with self.assertRaises(PromoCodeUsedUpError):
+            validate_promo_code('SALE')
+
+
+class CheckoutStockTests(TestCase):
+    """Checkout without Redis: stock is checked under the product lock and never oversold."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='buyer')
+        create_shipping_address(self.user)
+        self.category = Category.objects.create(name='Shirts')
+        self.product = Product.objects.create(name='Shirt', description='', price=10, quantity=3,
+                                              category=self.category)
+
+    def test_shortage_rejects_the_whole_checkout(self):
+        other = Product.objects.create(name='Hat', description='', price=5, quantity=10, category=self.category)
+        ShoppingCart.objects.create(user_id=self.user, product_id=self.product, count_product=4)
+        ShoppingCart.objects.create(user_id=self.user, product_id=other, count_product=1)
+
+        with self.assertRaises(InsufficientStockError) as raised:
+            checkout(self.user.id)
+        self.assertEqual(raised.exception.shortages,
+                         [{'product_id': self.product.id, 'requested': 4, 'available': 3}])
+        self.assertEqual(list(Product.objects.order_by('id').values_list('quantity', 'sold_quantity')),
+                         [(3, 0), (10, 0)])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ShoppingCart.objects.filter(user_id=self.user).count(), 2)
+
+    def test_checkouts_never_sell_more_than_the_stock(self):
+        ShoppingCart.objects.create(user_id=self.user, product_id=self.product, count_product=2)
+        checkout(self.user.id)
+        ShoppingCart.objects.create(user_id=self.user, product_id=self.product, count_product=2)
+
+        with self.assertRaises(InsufficientStockError):
+            checkout(self.user.id)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.sold_quantity), (1, 2))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_record_sales_skips_products_short_of_stock(self):
+        sales = [(self.product.id, self.category.id, 2), (self.product.id, self.category.id, 2)]
+
+        self.assertEqual(record_sales(sales, take_stock=True), 0)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.quantity, self.product.sold_quantity), (3, 0))
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='buyer')
+
+    def create_orders(self, *statuses):
+        return [Order.objects.create(user=self.user, status=status).id for status in statuses]
+
+    def test_only_orders_allowed_to_move_are_moved(self):
+        processing, shipped, completed, cancelled = self.create_orders('processing', 'shipped', 'completed',
+                                                                       'cancelled')
+
+        moved = transition_orders(Order.objects.all(), 'shipped')
+
+        self.assertEqual(moved, [processing])
+        self.assertEqual(dict(Order.objects.values_list('id', 'status')), {
+            processing: 'shipped', shipped: 'shipped', completed: 'completed', cancelled: 'cancelled',
+        })
+        self.assertEqual(list(OrderStatusEvent.objects.values_list('order_id', 'from_status', 'to_status')),
+                         [(processing, 'processing', 'shipped')])
+
+    def test_batches_record_an_event_per_order_and_notify_once_per_batch(self):
+        order_ids = self.create_orders(*['processing'] * 5)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            moved = transition_orders(Order.objects.all(), 'cancelled', batch_size=2)
+
+        self.assertEqual(moved, order_ids)
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual(sorted(OrderStatusEvent.objects.filter(to_status='cancelled')
+                                .values_list('order_id', flat=True)), order_ids)
+
+    def test_unknown_status_is_rejected(self):
+        self.create_orders('processing')
+
+        with self.assertRaises(UnknownOrderStatusError):
+            transition_orders(Order.objects.all(), 'lost')
+        self.assertFalse(OrderStatusEvent.objects.exists())
+
+
+class CategoryCountTests(TestCase):
+    """Category.count_product, and the copy on DiscountCategory, follow every way products come and go."""
+
+    def setUp(self):
+        self.shirts = Category.objects.create(name='Shirts')
+        self.hats = Category.objects.create(name='Hats')
+        now = timezone.now()
+        self.hat_discount = DiscountCategory.objects.create(category=self.hats, discount_percentage=10,
+                                                            start_time=now, end_time=now + timedelta(days=1))
+
+    def create_product(self, category):
+        return Product.objects.create(name='Product', description='', price=1, category=category)
+
+    def counts(self):
+        self.hat_discount.refresh_from_db()
+        return (Category.objects.get(id=self.shirts.id).count_product,
+                Category.objects.get(id=self.hats.id).count_product,
+                self.hat_discount.count_product)
+
+    def test_create_move_and_delete(self):
+        product = self.create_product(self.shirts)
+        self.create_product(self.shirts)
+        self.assertEqual(self.counts(), (2, 0, 0))
+
+        product.category = self.hats
+        product.save()
+        self.assertEqual(self.counts(), (1, 1, 1))
+
+        # Saving again without a move changes nothing
+        product.save()
+        self.assertEqual(self.counts(), (1, 1, 1))
+
+        product.delete()
+        self.assertEqual(self.counts(), (1, 0, 0))
+
+    def test_bulk_created_products_are_counted_per_batch(self):
+        products = Product.objects.bulk_create(
+            [Product(name='Product', description='', price=1, category=category)
+             for category in (self.shirts, self.shirts, self.hats)]
+        )
+        adjust_product_counts(Counter(product.category_id for product in products))
+        self.assertEqual(self.counts(), (2, 1, 1))
+
+    def test_reconciliation_fixes_drifted_counts(self):
+        self.create_product(self.shirts)
+        self.create_product(self.hats)
+        Category.objects.filter(id=self.shirts.id).update(count_product=7)
+        DiscountCategory.objects.filter(id=self.hat_discount.id).update(count_product=3)
+
+        self.assertEqual(reconcile_category_counts(), 2)
+        self.assertEqual(self.counts(), (1, 1, 1))
+        self.assertEqual(reconcile_category_counts(), 0)
+
+
+class BatchCartTests(TestCase):
+    """POST main/batch-shopping_cart applies add/set/remove operations as one all-or-nothing upsert."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.addCleanup(setattr, redis_store, '_client', redis_store._client)
+        redis_store._client = self.redis
+
+        self.user = User.objects.create_user(username='buyer', password='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Shirts')
+        self.shirt, self.hat, self.scarf = (
+            Product.objects.create(name=name, description='', price=10, quantity=20, category=category)
+            for name in ('Shirt', 'Hat', 'Scarf')
+        )
+        get_cart_store().add(self.user.id, self.shirt.id, 2)
+        get_cart_store().add(self.user.id, self.hat.id, 1)
+
+    def post(self, *operations):
+        return self.client.post('/main/batch-shopping_cart', {'operations': [
+            {'op': op, 'product_id': product_id, 'count_product': count} for op, product_id, count in operations
+        ]}, format='json')
+
+    def cart(self):
+        return dict(ShoppingCart.objects.filter(user_id=self.user).values_list('product_id', 'count_product'))
+
+    def test_add_set_and_remove_upsert_in_order(self):
+        response = self.post(
+            ('add', self.shirt.id, 3),     # adds to the two already in the cart
+            ('set', self.hat.id, 4),       # overwrites
+            ('set', self.scarf.id, 1),     # inserts
+            ('remove', self.scarf.id, 1),  # applied after the insert above
+            ('remove', self.scarf.id, 1),  # no longer in the cart, ignored
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['product']['id'], item['count_product']) for item in response.data],
+                         [(self.shirt.id, 5), (self.hat.id, 4)])
+        self.assertEqual(self.cart(), {self.shirt.id: 5, self.hat.id: 4})
+        self.assertEqual(get_cart_store().items(self.user.id), {self.shirt.id: 5, self.hat.id: 4})
+
+    def test_unknown_product_rolls_back_the_whole_batch(self):
+        missing = self.scarf.id + 100
+        response = self.post(('add', self.shirt.id, 3), ('remove', self.hat.id, 1), ('set', missing, 1))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['product_ids'], [missing])
+        self.assertEqual(self.cart(), {self.shirt.id: 2, self.hat.id: 1})
+
+
+class ProductImportTests(TestCase):
+    """Bulk imports through main.importers and the JSONL report they write."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.feed_path = os.path.join(directory.name, 'products.jsonl')
+        self.report_path = os.path.join(directory.name, 'report.jsonl')
+        self.category = Category.objects.create(name='Shirts')
+
+    def write_feed(self, lines):
+        with open(self.feed_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def read_report(self):
+        with open(self.report_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_invalid_rows_are_reported_and_the_rest_imported(self):
+        self.write_feed([
+            json.dumps({'name': 'Shirt', 'price': 10, 'category_id': self.category.id, 'sizes': ['S', 'M']}),
+            '{"name": "Broken",',
+            json.dumps({'price': 10, 'category_id': self.category.id}),
+            '',
+            json.dumps({'name': 'Hat', 'price': 5, 'category_id': self.category.id + 100}),
+            json.dumps({'name': 'Scarf', 'price': 7, 'category_id': self.category.id, 'colors': ['Red']}),
+        ])
+
+        summary = import_products(self.feed_path, self.report_path, batch_size=2)
+
+        self.assertEqual(summary, {'rows': 5, 'created': 2, 'errors': 3})
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Scarf', 'Shirt'])
+        self.assertEqual(Category.objects.get(id=self.category.id).count_product, 2)
+
+        report = self.read_report()
+        self.assertEqual([event['event'] for event in report],
+                         ['started', 'error', 'progress', 'error', 'error', 'progress', 'progress', 'finished'])
+        errors = {event['line']: event['errors'] for event in report if event['event'] == 'error'}
+        self.assertEqual(sorted(errors), [2, 3, 5])
+        self.assertIn('non_field_errors', errors[2])
+        self.assertIn('name', errors[3])
+        self.assertEqual(errors[5], {'category_id': [f'Category {self.category.id + 100} does not exist']})
+        self.assertEqual(report[-1], {'event': 'finished', **summary})
+
+
+class ProductExportTests(TestCase):
+    """NDJSON exports through main.exporters, read back by the importer."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        self.category = Category.objects.create(name='Shirts')
+        sizes = [Size.objects.create(name=name) for name in ('S', 'M')]
+        colors = [Color.objects.create(name=name) for name in ('Red', 'Blue')]
+        for index in range(3):
+            product = Product.objects.create(name=f'Shirt {index}', description=f'Cotton {index}', price=10 + index,
+                                             rate=index, quantity=5, sold_quantity=index, category=self.category)
+            ProductSizeColor.objects.bulk_create([ProductSizeColor(product=product, size=size, color=color)
+                                                  for size in sizes for color in colors])
+        Product.objects.create(name='Plain', description='', price=1, category=self.category)
+
+    def export(self, **kwargs):
+        return [json.loads(line) for line in b''.join(export_products(**kwargs)).splitlines()]
+
+    @staticmethod
+    def comparable(row):
+        return {
+            **{field: row[field] for field in ('name', 'description', 'price', 'rate', 'quantity', 'sold_quantity')},
+            'category': row['category'],
+            'variants': sorted((variant['size'] and variant['size']['name'],
+                                variant['color'] and variant['color']['name']) for variant in row['variants']),
+        }
+
+    def test_exported_rows_import_back_unchanged(self):
+        exported = self.export()
+        self.assertEqual(len(exported), 4)
+        self.assertEqual(len(exported[0]['variants']), 4)
+
+        feed_path = os.path.join(self.directory, 'products.jsonl')
+        with open(feed_path, 'w', encoding='utf-8') as f:
+            for row in exported:
+                f.write(json.dumps({
+                    **{field: row[field] for field in ('name', 'description', 'price', 'rate', 'quantity',
+                                                       'sold_quantity')},
+                    'category_id': row['category']['id'],
+                    'sizes': list(dict.fromkeys(v['size']['name'] for v in row['variants'] if v['size'])),
+                    'colors': list(dict.fromkeys(v['color']['name'] for v in row['variants'] if v['color'])),
+                }) + '\n')
+        summary = import_products(feed_path, os.path.join(self.directory, 'report.jsonl'))
+        self.assertEqual(summary, {'rows': 4, 'created': 4, 'errors': 0})
+
+        imported = self.export(after_id=exported[-1]['id'])
+        self.assertEqual([self.comparable(row) for row in imported], [self.comparable(row) for row in exported])
+        # The existing sizes and colors were reused
+        self.assertEqual((Size.objects.count(), Color.objects.count()), (2, 2))
+
+    def test_gzip_export_and_resuming_after_an_id(self):
+        exported = self.export(chunk_size=2)
+        compressed = b''.join(export_products(compress=True))
+
+        self.assertEqual(zlib.decompress(compressed, wbits=16 + zlib.MAX_WBITS), b''.join(export_products()))
+        self.assertEqual(self.export(after_id=exported[1]['id']), exported[2:])
+
+
+class TopSellerPagingTests(TestCase):
+    """Cursor paging of main/get-top-products-by-category-id over ties in ``sold_quantity``."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Shirts')
+        other = Category.objects.create(name='Hats')
+        for sold_quantity in (3, 1, 3, 1, 1, 3, 0, 1):
+            Product.objects.create(name='Shirt', description='', price=1, sold_quantity=sold_quantity,
+                                   category=self.category)
+        Product.objects.create(name='Hat', description='', price=1, sold_quantity=2, category=other)
+        self.expected = list(Product.objects.filter(category=self.category)
+                             .order_by('-sold_quantity', '-id').values_list('id', flat=True))
+
+    def page_through(self, page_size=3):
+        url = f'/main/get-top-products-by-category-id/{self.category.id}?page_size={page_size}'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    @override_settings(REDIS_URL=None)
+    def test_keyset_pages_have_no_duplicates_or_gaps(self):
+        self.addCleanup(setattr, redis_store, '_client', redis_store._client)
+        redis_store._client = None
+
+        for page_size in (1, 2, 3, 8, 9):
+            self.assertEqual(self.page_through(page_size), self.expected)
+
+    def test_leaderboard_pages_match_the_database_order(self):
+        self.addCleanup(setattr, redis_store, '_client', redis_store._client)
+        redis_store._client = fakeredis.FakeRedis()
+        get_leaderboard().rebuild()
+
+        for page_size in (1, 3, 8):
+            self.assertEqual(self.page_through(page_size), self.expected)
+
+
+class ConditionalCatalogTests(TestCase):
+    """Catalog ETags come from the version counters and move on with every write."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Category.objects.create(name='Shirts')
+
+    def test_matching_etag_is_answered_with_304_until_a_write(self):
+        response = self.client.get('/main/get-categories')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/main/get-categories', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Category.objects.create(name='Hats')
+
+        response = self.client.get('/main/get-categories', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Hats', response.content.decode())
@@ -4,12 +4,17 @@ from main.views import *
 
 urlpatterns = [
     path('add-product', CreateProductAPIView.as_view(), name='add-product'),
+    path('import-products', ProductImportAPIView.as_view(), name='import-products'),
+    path('import-products/<str:import_id>', ProductImportStatusAPIView.as_view(), name='import-products-status'),
+    path('export-products', ProductExportAPIView.as_view(), name='export-products'),
     path('add-category', CreateCategoryAPIView.as_view(), name='add-category'),
     path('add-color', CreateColorAPIView.as_view(), name='add-color'),
     path('add-size', CreateSizeAPIView.as_view(), name='add-size'),
+    path('product-detail/<int:pk>', ProductDetailAPIView.as_view(), name='product-detail'),
     path('product-get-update-delete/<int:pk>', ProductUpdateAPIView.as_view(), name='product-get'),
     path('category-get/<int:pk>', CategoryGetAPIView.as_view(), name='category-get'),
     path('search-category/', SearchCategoryAPIView.as_view(), name='search-category'),
+    path('search-products/', SearchProductAPIView.as_view(), name='search-products'),
     path('color-get/<int:pk>', ColorGetAPIView.as_view(), name='color-get'),
     path('size-get/<int:pk>', SizeGetAPIView.as_view(), name='size-get'),
     path('get-product-sizes/<int:pk>', GetProductSizesAPIView.as_view(), name='get-product-sizes'),
@@ -29,12 +34,16 @@ urlpatterns = [
     path('get-shopping-cart-products', ShoppingCartListUpdateDelete.as_view(), name='get-shopping-cart-products'),
     path('add-shopping_cart', AddToShoppingCartAPIView.as_view(), name='add-shopping_cart'),
     path('update-count-product-shopping_cart', UpdateShoppingCartAPIView.as_view(), name='update-count-product-shopping_cart'),
+    path('batch-shopping_cart', BatchShoppingCartAPIView.as_view(), name='batch-shopping_cart'),
     path('delete-shopping_cart/<int:product_id>', DeleteShoppingCartAPIView.as_view(), name='delete-shopping_cart'),
     path('filter', FilterProductsAPIView.as_view(), name='filter'),
     path('promocode', PromoCodeAPIView.as_view(), name='promo_code'),
     path('order', CreateOrderAPIView.as_view(), name='order'),
     path('get-order', GetOrderAPIView.as_view(), name='get-order'),
+    path('get-order/summary', OrderSummaryAPIView.as_view(), name='get-order-summary'),
+    path('get-order/<int:pk>', OrderDetailAPIView.as_view(), name='get-order-detail'),
     path('update-order', UpdateUserOrderAPIView.as_view(), name='update-order'),
+    path('order-status', OrderStatusBatchAPIView.as_view(), name='order-status'),
     path('payment', PaymentAPIView.as_view(), name='payment'),
     path('user-wallet', GetUserWalletAPIView.as_view(), name='user-wallet'),
     # path('get-similar-products/', GetSimilarProductsAPIView.as_view(), name='similar-products')
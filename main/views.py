@@ -1,14 +1,20 @@
 import datetime
 import os
+import uuid
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_save, post_delete
+from django.http import StreamingHttpResponse
 from django.dispatch import receiver
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.generics import (
     CreateAPIView, ListAPIView,
     GenericAPIView, RetrieveUpdateDestroyAPIView,
@@ -21,28 +27,47 @@ from rest_framework.views import APIView
 
 from accounts.permissions import AdminPermission
 from accounts.serializers import User
-from customer.models import ShippingAddress
+from .carts import get_cart_store, UnknownProductsError
+from .cache import reference_caches, conditional_catalog, bump_version, PRODUCTS_BY_CATEGORY_CACHE_KEY
+from .counters import adjust_product_counts
+from .mixins import EagerLoadingViewMixin, CachedListMixin, CachedRetrieveMixin, FastListMixin
+from .filters import filter_products, product_facets
+from .exporters import export_products
+from .importers import detect_format, read_report_status
+from .checkout import checkout, CheckoutError, InsufficientStockError, MissingShippingAddressError
+from .leaderboards import get_leaderboard, update_leaderboard
+from .pagination import KeysetPagination, LeaderboardPagination
+from .orders import transition_orders, order_summary
+from .reservations import get_reservations, OutOfStockError
+from .promos import promo_code_cache, validate_promo_code, redeem_promo_code, PromoCodeError, PromoCodeNotFoundError
+from .product_detail import get_product_detail, invalidate_product_detail
+from .search import get_search_backend
+from .tasks import import_products
+from .wallets import open_wallet, debit, WalletNotFoundError, IdempotencyKeyReusedError, WalletError
 from .models import (
     Product, Color,
     Category, Size,
     File, ProductSizeColor,
     Order, UserWallet,
-    ShoppingCart, PromoCode,
+    PromoCode,
     ReviewModel, LikeModel
 )
 from .serializers import (
-    CreateProductSerializer, ProductListSerializer,
+    CreateProductSerializer, ProductListSerializer, PricedListSerializer,
     CategorySerializer, ColorSerializer,
     SizeSerializer, FileUploadSerializer,
     ProductAddSizeColorSerializer, GetProductSizeColorSerializer,
     AddCategorySerializer, GetSizeColorSerializer,
     GetProductSizeSerializer, TemporarilyPhotosSerializer,
     AddToShoppingCartSerializer, FilterQuerySerializer,
-    PromoCodeSerializer, QuerySerializer,
+    CartBatchSerializer,
+    PromoCodeSerializer, RedeemPromoCodeSerializer, QuerySerializer,
+    ProductSearchQuerySerializer, ProductImportSerializer,
+    ProductExportQuerySerializer,
     ReviewSerializersRes, ReviewSerializer,
     LikeSerializersRes, ProductFileSerializer,
-    CreateOrderSerializer, GetOrderSerializer,
-    UpdateOrderSerializer, PaymentSerializer,
+    OrderDetailSerializer, GetOrderSerializer,
+    UpdateOrderSerializer, OrderStatusBatchSerializer, OrderHistoryQuerySerializer, OrderSummarySerializer, PaymentSerializer,
     UserWalletSerializer
 )
 
@@ -61,23 +86,44 @@ class CreateProductAPIView(CreateAPIView):
             return Response({'message': 'Product data invalid'})
 
 
-class GetProductsByCategoryIdAPIView(GenericAPIView):
+@conditional_catalog('product', 'category', 'discount')
+class GetProductsByCategoryIdAPIView(FastListMixin, EagerLoadingViewMixin, GenericAPIView):
     permission_classes = ()
     serializer_class = ProductListSerializer
+    queryset = Product.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
+    fast_render = True
 
     def get(self, request, category_id):
         try:
-            product_data = Product.objects.filter(category_id=category_id)
-            product_serializer = ProductListSerializer(product_data, many=True)
-            return Response(data=product_serializer.data, status=200)
+            product_data = self.paginate_and_serialize(self.get_queryset().filter(category_id=category_id))
+            return self.get_paginated_response(product_data)
+        except APIException:
+            # e.g. NotFound for a bad pagination cursor, answered by DRF
+            raise
         except Exception as e:
             return Response(status=401, data=f'{e}')
 
 
+class ProductDetailAPIView(APIView):
+    permission_classes = ()
+
+    def get(self, request, pk):
+        data = get_product_detail(pk)
+        if data is None:
+            return Response({'message': 'Product not found!'}, status=status.HTTP_404_NOT_FOUND)
+
+        files = [{**file, 'url': file['url'] and request.build_absolute_uri(file['url'])} for file in data['files']]
+        # Priced on every read; the cached page does not follow the discounts
+        [product] = PricedListSerializer.finalize_rows([data['product']], {'request': request})
+        return Response({**data, 'product': product, 'files': files})
+
+
 class ProductUpdateAPIView(RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, AdminPermission)
     serializer_class = CreateProductSerializer
-    queryset = Product.objects.all()
+    queryset = ProductListSerializer.setup_eager_loading(Product.objects.all())
 
     def get(self, request, pk):
         try:
@@ -136,34 +182,117 @@ class CreateCategoryAPIView(CreateAPIView):
     serializer_class = AddCategorySerializer
 
 
-class CategoryGetAPIView(RetrieveAPIView):
+@conditional_catalog('category')
+class CategoryGetAPIView(CachedRetrieveMixin, RetrieveAPIView):
     queryset = Category.objects.all()
     permission_classes = ()
     serializer_class = CategorySerializer
+    cache_namespace = 'category'
 
 
-class CategoryListAPIView(ListAPIView):
+@conditional_catalog('category')
+class CategoryListAPIView(CachedListMixin, ListAPIView):
     queryset = Category.objects.all()
     permission_classes = ()
     serializer_class = CategorySerializer
+    cache_namespace = 'category'
 
 
-class ColorListAPIView(ListAPIView):
+@conditional_catalog('color')
+class ColorListAPIView(CachedListMixin, ListAPIView):
     queryset = Color.objects.all()
     permission_classes = ()
     serializer_class = ColorSerializer
+    cache_namespace = 'color'
 
 
-class SizeListAPIView(ListAPIView):
+@conditional_catalog('size')
+class SizeListAPIView(CachedListMixin, ListAPIView):
     queryset = Size.objects.all()
     permission_classes = ()
     serializer_class = SizeSerializer
+    cache_namespace = 'size'
 
 
-class SizeGetAPIView(RetrieveAPIView):
+@conditional_catalog('size')
+class SizeGetAPIView(CachedRetrieveMixin, RetrieveAPIView):
     queryset = Size.objects.all()
     permission_classes = ()
     serializer_class = SizeSerializer
+    cache_namespace = 'size'
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+def invalidate_reference_cache(sender, **kwargs):
+    reference_caches[sender._meta.model_name].invalidate()
+
+
+def import_report_path(import_id):
+    return os.path.join(settings.PRODUCT_IMPORT_DIR, f'{import_id}.report.jsonl')
+
+
+class ProductImportAPIView(GenericAPIView):
+    permission_classes = (IsAuthenticated, AdminPermission)
+    parser_classes = (MultiPartParser, FormParser)
+    serializer_class = ProductImportSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        uploaded_file = serializer.validated_data['file']
+        try:
+            file_format = serializer.validated_data.get('format') or detect_format(uploaded_file.name)
+        except ValueError as e:
+            return Response({'format': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        import_id = uuid.uuid4().hex
+        os.makedirs(settings.PRODUCT_IMPORT_DIR, exist_ok=True)
+        path = os.path.join(settings.PRODUCT_IMPORT_DIR, f'{import_id}.{file_format}')
+        with open(path, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+
+        import_products.delay(path, import_report_path(import_id), file_format,
+                              serializer.validated_data.get('batch_size'))
+        return Response({'import_id': import_id}, status=status.HTTP_202_ACCEPTED)
+
+
+class ProductImportStatusAPIView(APIView):
+    permission_classes = (IsAuthenticated, AdminPermission)
+
+    def get(self, request, import_id):
+        try:
+            report = read_report_status(import_report_path(uuid.UUID(import_id).hex))
+        except (ValueError, FileNotFoundError):
+            return Response({'message': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'import_id': import_id, 'status': report})
+
+
+class ProductExportAPIView(APIView):
+    permission_classes = (IsAuthenticated, AdminPermission)
+
+    @swagger_auto_schema(query_serializer=ProductExportQuerySerializer)
+    def get(self, request):
+        serializer = ProductExportQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        after_id = serializer.validated_data.get('after_id')
+        if serializer.validated_data.get('compression') == 'gzip':
+            response = StreamingHttpResponse(export_products(after_id, compress=True),
+                                             content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="products.ndjson.gz"'
+        else:
+            response = StreamingHttpResponse(export_products(after_id), content_type='application/x-ndjson')
+            response['Content-Disposition'] = 'attachment; filename="products.ndjson"'
+        return response
 
 
 class FileUploadAPIView(GenericAPIView):
@@ -185,17 +314,26 @@ class FileUploadAPIView(GenericAPIView):
         )
 
 
+@conditional_catalog('product')
 class ProductFileGetDelete(APIView):
     parser_classes = (MultiPartParser, FormParser, FileUploadParser)
     permission_classes = ()
     serializer_class = ProductFileSerializer
 
-    def get(self, request, hash_code):
+    def get(self, request, pk=None, hash_code=None):
+        if pk is not None:
+            files = File.objects.filter(product_id=pk)
+            file_serializer = self.serializer_class(files, many=True)
+            return Response(file_serializer.data)
+
         file_instance = get_object_or_404(File, hash=hash_code)
         file_serializer = self.serializer_class(file_instance)
         return Response(file_serializer.data)
 
-    def delete(self, request, hash_code):
+    def delete(self, request, pk=None, hash_code=None):
+        if hash_code is None:
+            return Response({'message': 'File hash is required'}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             file_instance = File.objects.get(hash=hash_code)
         except File.DoesNotExist:
@@ -210,6 +348,7 @@ class ProductFileGetDelete(APIView):
             return Response({'message': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@conditional_catalog('product', 'size')
 class GetProductSizesAPIView(GenericAPIView):
     permission_classes = ()
     serializer_class = ProductAddSizeColorSerializer
@@ -217,13 +356,16 @@ class GetProductSizesAPIView(GenericAPIView):
 
     def get(self, request, pk):
         try:
-            product_detail = ProductSizeColor.objects.filter(product_id=pk)
+            product_detail = GetProductSizeSerializer.setup_eager_loading(
+                ProductSizeColor.objects.filter(product_id=pk)
+            )
             product_detail_serializer = GetProductSizeSerializer(product_detail, many=True)
             return Response(product_detail_serializer.data)
         except Exception as e:
             return Response({'detail': f'{e}'}, status=401)
 
 
+@conditional_catalog('product', 'color')
 class GetColorByProductSizeIdAPIView(APIView):
     permission_classes = ()
 
@@ -233,7 +375,9 @@ class GetColorByProductSizeIdAPIView(APIView):
             size_id = request.GET.get('size_id')
 
             if product_id is not None and size_id is not None:
-                data = ProductSizeColor.objects.filter(Q(product_id=product_id) & Q(size_id=size_id))
+                data = GetSizeColorSerializer.setup_eager_loading(
+                    ProductSizeColor.objects.filter(Q(product_id=product_id) & Q(size_id=size_id))
+                )
                 data_serializer = GetSizeColorSerializer(data, many=True)
                 return Response(data_serializer.data)
             else:
@@ -264,12 +408,13 @@ class AddProductSizeColorAPIView(GenericAPIView):
             return Response({'detail': f'{e}'})
 
 
-class AllProductSizeColorAPIView(GenericAPIView):
+class AllProductSizeColorAPIView(EagerLoadingViewMixin, GenericAPIView):
     permission_classes = ()
     serializer_class = GetProductSizeColorSerializer
+    queryset = ProductSizeColor.objects.all()
 
     def get(self, request):
-        data = ProductSizeColor.objects.all()
+        data = self.get_queryset()
         data_serializer = self.serializer_class(data, many=True)
         return Response(data_serializer.data)
 
@@ -277,65 +422,108 @@ class AllProductSizeColorAPIView(GenericAPIView):
 @receiver(post_save, sender=Product)
 def update_category_count(sender, instance, created, **kwargs):
     if created:
-        category = instance.category
-        if category:
-            category.count_product = Product.objects.filter(category=category).count()
-            category.save()
+        adjust_product_counts({instance.category_id: 1})
+        return
+
+    previous_category_id = getattr(instance, '_loaded_category_id', None)
+    if previous_category_id is not None and previous_category_id != instance.category_id:
+        adjust_product_counts({previous_category_id: -1, instance.category_id: 1})
+
+
+@receiver(post_delete, sender=Product)
+def decrease_category_count(sender, instance, **kwargs):
+    adjust_product_counts({instance.category_id: -1})
 
 
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_products_by_category(sender, **kwargs):
+    cache.delete(PRODUCTS_BY_CATEGORY_CACHE_KEY)
+
+
+@conditional_catalog('product', 'category', 'discount')
 class ProductListByOtherCategoryAPIView(APIView):
     permission_classes = ()
 
     def get(self, request):
         try:
-            categories = Category.objects.all()
-            data = []
-            for category in categories:
-                product = Product.objects.filter(category_id=category.id).first()
-                if product:
-                    product_serializer = ProductListSerializer(product)
-                    data.append(product_serializer.data)
+            data = cache.get(PRODUCTS_BY_CATEGORY_CACHE_KEY)
+            if data is None:
+                # The first product of every category, picked in a single query
+                products = ProductListSerializer.setup_eager_loading(
+                    Product.objects.annotate(
+                        category_row=Window(RowNumber(), partition_by=F('category_id'), order_by=F('id').asc())
+                    ).filter(category_row=1).order_by('category_id')
+                )
+                data = ProductListSerializer(products, many=True, context={'request': request}).data
+                cache.set(PRODUCTS_BY_CATEGORY_CACHE_KEY, data, timeout=None)
+            else:
+                # Prices follow the discounts, which the cached rows do not
+                data = PricedListSerializer.finalize_rows(data, {'request': request})
             return Response(data=data)
         except Exception as e:
             return Response({'detail': str(e)})
 
 
-class GetTopProductsByCategoryAPIView(GenericAPIView):
+@conditional_catalog('product', 'category', 'discount')
+class GetTopProductsByCategoryAPIView(FastListMixin, EagerLoadingViewMixin, GenericAPIView):
     permission_classes = ()
     serializer_class = ProductListSerializer
+    queryset = Product.objects.all()
+    pagination_class = LeaderboardPagination
+    keyset_ordering = ('-sold_quantity', '-id')
+    fast_render = True
+
+    def get_leaderboard_params(self):
+        return self.kwargs['category_id'], None
 
     def get(self, request, category_id):
         try:
-            product = Product.objects.filter(category_id=category_id).order_by('-sold_quantity')
-            product_serializer = self.serializer_class(product, many=True)
-            return Response(product_serializer.data)
+            product = self.paginate_and_serialize(self.get_queryset().filter(category_id=category_id))
+            return self.get_paginated_response(product)
+        except APIException:
+            raise
         except Exception as e:
             return Response({'error': f'{e}'})
 
 
-class GetNewArrivalsProductAPIView(GenericAPIView):
+@conditional_catalog('product', 'category', 'discount', bucket_seconds=300)
+class GetNewArrivalsProductAPIView(FastListMixin, EagerLoadingViewMixin, GenericAPIView):
     permission_classes = ()
     serializer_class = ProductListSerializer
+    queryset = Product.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
+    fast_render = True
 
     def get(self, request):
         try:
             three_days_ago = datetime.datetime.now() - datetime.timedelta(days=3)
-            data = Product.objects.filter(created_at__gte=three_days_ago)
-            data_serializer = self.serializer_class(data, many=True)
-            return Response(data_serializer.data)
+            data = self.paginate_and_serialize(self.get_queryset().filter(created_at__gte=three_days_ago))
+            return self.get_paginated_response(data)
+        except APIException:
+            raise
         except Exception as e:
             return Response({'detail': str(e)})
 
 
-class GetPopularProductAPIView(GenericAPIView):
+@conditional_catalog('product', 'category', 'discount')
+class GetPopularProductAPIView(FastListMixin, EagerLoadingViewMixin, GenericAPIView):
     permission_classes = ()
     serializer_class = ProductListSerializer
+    queryset = Product.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-rate', '-id')
+    fast_render = True
 
     def get(self, request):
         try:
-            data = Product.objects.filter(rate__gte=3).order_by('-rate')
-            product_serializer = self.serializer_class(data, many=True)
-            return Response(product_serializer.data)
+            data = self.paginate_and_serialize(self.get_queryset().filter(rate__gte=3))
+            return self.get_paginated_response(data)
+        except APIException:
+            raise
         except Exception as e:
             return Response({'error': f'{e}'})
 
@@ -350,10 +538,15 @@ class AddToShoppingCartAPIView(CreateAPIView):
             product_id = serializer.validated_data.get('product_id')
             count_product = serializer.validated_data.get('count_product')
             user = request.user.id
-            if ShoppingCart.objects.filter(product_id=product_id, user_id=user).exists():
+            try:
+                added = get_cart_store().add(user, product_id, count_product)
+            except OutOfStockError as e:
+                return Response({'message': str(e), 'products': e.shortages}, status=status.HTTP_400_BAD_REQUEST)
+            if not added:
+                if not Product.objects.filter(id=product_id).exists():
+                    return Response({"message": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
                 return Response({"message": "Product already exists in the shopping cart."},
                                 status=status.HTTP_400_BAD_REQUEST)
-            ShoppingCart.objects.create(product_id=product_id, user_id_id=user, count_product=count_product)
             return Response({"message": "Product added to the shopping cart successfully."},
                             status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -365,20 +558,39 @@ class ShoppingCartListUpdateDelete(GenericAPIView):
 
     def get(self, request):
         user_id = request.user.id
-        shopping_cart_detail = ShoppingCart.objects.filter(user_id=user_id)
-        print(shopping_cart_detail.values())
+        shopping_cart_detail = get_cart_store().products(user_id)
         if shopping_cart_detail:
-            data = []
-            for item in shopping_cart_detail.values():
-                product = Product.objects.get(id=item.get('product_id_id'))
-                if product:
-                    product_serializer = ProductListSerializer(product)
-                    data.append(product_serializer.data)
-            return Response(data=data)
+            products = [product for product, count in shopping_cart_detail]
+            product_serializer = ProductListSerializer(products, many=True)
+            return Response(data=product_serializer.data)
         else:
             return Response({"message": "Shopping cart is empty."}, status=404)
 
 
+class BatchShoppingCartAPIView(GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = CartBatchSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cart = get_cart_store().apply(request.user.id, serializer.validated_data['operations'])
+        except UnknownProductsError as e:
+            return Response({'message': 'Product not found.', 'product_ids': e.product_ids},
+                            status=status.HTTP_404_NOT_FOUND)
+        except OutOfStockError as e:
+            return Response({'message': str(e), 'products': e.shortages}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = ProductListSerializer([product for product, count in cart], many=True).data
+        return Response([
+            {'product': product, 'count_product': count}
+            for product, (_, count) in zip(products, cart)
+        ])
+
+
 class DeleteShoppingCartAPIView(DestroyAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = AddToShoppingCartSerializer
@@ -386,18 +598,15 @@ class DeleteShoppingCartAPIView(DestroyAPIView):
     def delete(self, request, product_id):
         user_id = request.user.id
         if product_id:
-            if ShoppingCart.objects.filter(product_id=product_id, user_id=user_id).exists():
-                try:
-                    ShoppingCart.objects.get(Q(user_id_id=user_id) & Q(product_id=product_id)).delete()
-                    return Response(status=201)
-                except Exception as e:
-                    return Response({'message': 'Product not found', 'error': f'{e}'}, status=404)
+            if get_cart_store().remove(user_id, product_id):
+                return Response(status=201)
             else:
                 return Response({'message': 'Product in Shopping cart not found !'})
         else:
             return Response({'message': 'product_id invalid !'})
 
 
+@conditional_catalog('category')
 class SearchCategoryAPIView(GenericAPIView):
     permission_classes = ()
     serializer_class = CategorySerializer
@@ -415,60 +624,170 @@ class SearchCategoryAPIView(GenericAPIView):
             return Response({'message': 'No categories found for the query'}, status=404)
 
 
-class FilterProductsAPIView(GenericAPIView):
+@conditional_catalog('product', 'category', 'discount', bucket_seconds=300)
+class FilterProductsAPIView(FastListMixin, EagerLoadingViewMixin, GenericAPIView):
     serializer_class = ProductListSerializer
+    queryset = Product.objects.all()
+    pagination_class = LeaderboardPagination
+    fast_render = True
+
+    def get_leaderboard_params(self):
+        params = self.request.GET
+        if params.get('sort') != 'Top_sellers' or params.get('rate') or params.get('start_price'):
+            return None
+        return params.get('category_id') or None, 2
+
+    def get_keyset_ordering(self):
+        sort = self.request.GET.get('sort')
+        if sort == 'Top_sellers':
+            return '-sold_quantity', '-id'
+        if sort in ('New_Today', 'New_This_Week'):
+            return '-created_at', '-id'
+        return '-id',
 
     @swagger_auto_schema(query_serializer=FilterQuerySerializer)
     def get(self, request):
-        category_id = request.GET.get('category_id')
-        start_price = request.GET.get('start_price')
-        end_price = request.GET.get('end_price')
         sort = request.GET.get('sort')
-        rate = request.GET.get('rate')
-
-        query = Product.objects.all()
+        facets = request.GET.get('facets') in ('1', 'true', 'True')
 
         try:
-            if category_id:
-                query = query.filter(category_id=category_id)
-            if start_price and end_price:
-                query = query.filter(price__gte=start_price, price__lte=end_price)
+            query = self.get_queryset()
             if sort:
                 if sort == 'New_Today':
-                    query = query.filter(created_at__day=datetime.datetime.now() - datetime.timedelta(days=1))
+                    query = query.filter(created_at__gte=datetime.datetime.now() - datetime.timedelta(days=1))
                 elif sort == 'New_This_Week':
-                    query = query.filter(created_at__day=datetime.datetime.now() - datetime.timedelta(days=7))
+                    query = query.filter(created_at__gte=datetime.datetime.now() - datetime.timedelta(days=7))
                 elif sort == 'Top_sellers':
-                    query = query.filter(sold_quantity__gte=2).order_by('-sold_quantity')
-            if rate:
-                query = query.filter(rate__gte=rate)
-            query_serializer = self.serializer_class(query, many=True)
-            return Response(query_serializer.data)
+                    query = query.filter(sold_quantity__gte=2)
+            products = self.paginate_and_serialize(filter_products(query, request.GET))
+            response = self.get_paginated_response(products)
+            if facets:
+                response.data['facets'] = product_facets(query, request.GET)
+            return response
+        except APIException:
+            raise
         except Exception as e:
             return Response({'error': str(e)})
 
 
+@conditional_catalog('product', 'category', 'discount')
+class SearchProductAPIView(EagerLoadingViewMixin, GenericAPIView):
+    permission_classes = ()
+    serializer_class = ProductListSerializer
+    queryset = Product.objects.all()
+
+    @swagger_auto_schema(query_serializer=ProductSearchQuerySerializer)
+    def get(self, request):
+        query_serializer = ProductSearchQuerySerializer(data=request.query_params)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = query_serializer.validated_data
+        limit = params.get('limit') or settings.PRODUCT_PAGE_SIZE
+        products = get_search_backend().search(
+            filter_products(self.get_queryset(), params), params['query'], limit
+        )
+        product_serializer = self.serializer_class(products, many=True)
+        return Response(product_serializer.data)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductSizeColor)
+@receiver(post_delete, sender=ProductSizeColor)
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def bump_product_version(sender, **kwargs):
+    bump_version('product')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_page(sender, instance, **kwargs):
+    invalidate_product_detail(instance.id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reload_product_stock(sender, instance, **kwargs):
+    reservations = get_reservations()
+    if reservations is not None:
+        transaction.on_commit(lambda: reservations.forget([instance.id]))
+
+
+@receiver(post_save, sender=ProductSizeColor)
+@receiver(post_delete, sender=ProductSizeColor)
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def invalidate_product_page_media(sender, instance, **kwargs):
+    invalidate_product_detail(instance.product_id)
+
+
+@receiver(post_save, sender=ReviewModel)
+@receiver(post_delete, sender=ReviewModel)
+@receiver(post_save, sender=LikeModel)
+@receiver(post_delete, sender=LikeModel)
+def invalidate_product_page_reviews(sender, instance, **kwargs):
+    invalidate_product_detail(instance.product_id_id)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    get_search_backend().update(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_product_leaderboard(sender, instance, **kwargs):
+    leaderboard = get_leaderboard()
+    if leaderboard is not None:
+        update_leaderboard(leaderboard.add, instance.id, instance.category_id, instance.sold_quantity,
+                           previous_category_id=getattr(instance, '_loaded_category_id', None))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_leaderboard(sender, instance, **kwargs):
+    leaderboard = get_leaderboard()
+    if leaderboard is not None:
+        update_leaderboard(leaderboard.remove, instance.id, instance.category_id)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance.id)
+
+
 class PromoCodeAPIView(GenericAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = PromoCodeSerializer
 
+    def promo_code_response(self, func, code):
+        try:
+            promo_code = func(code)
+        except PromoCodeNotFoundError as e:
+            return Response({'message': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except PromoCodeError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data_serializer = self.serializer_class(promo_code)
+        return Response(data_serializer.data)
+
     @swagger_auto_schema(query_serializer=QuerySerializer)
     def get(self, request):
+        """Check a code without using it, served from the promo code cache."""
         query = request.query_params.get('query')
-        try:
-            promo_code = PromoCode.objects.get(code=query)
-        except PromoCode.DoesNotExist:
-            return Response({'message': 'PromoCode not found'}, status=status.HTTP_404_NOT_FOUND)
+        return self.promo_code_response(validate_promo_code, query)
 
-        if promo_code.start_date > timezone.now():
-            return Response({'message': 'PromoCode is not active yet'}, status=status.HTTP_400_BAD_REQUEST)
+    @swagger_auto_schema(request_body=RedeemPromoCodeSerializer)
+    def post(self, request):
+        """Use a code once; never exceeds its ``max_usage`` under concurrent requests."""
+        serializer = RedeemPromoCodeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.promo_code_response(redeem_promo_code, serializer.validated_data['code'])
 
-        if promo_code.end_date < timezone.now():
-            return Response({'message': 'PromoCode expired'}, status=status.HTTP_400_BAD_REQUEST)
-        promo_code.current_usage += 1
-        promo_code.save()
-        data_serializer = self.serializer_class(promo_code)
-        return Response(data_serializer.data)
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def invalidate_promo_code_cache(sender, **kwargs):
+    promo_code_cache.invalidate()
 
 
 class UpdateShoppingCartAPIView(GenericAPIView):
@@ -477,14 +796,18 @@ class UpdateShoppingCartAPIView(GenericAPIView):
 
     def patch(self, request):
         user_id = request.user.id
-        product_id = request.data.get('product_id')
-        count_product = request.data.get('count_product')
-        shopping_cart_item = get_object_or_404(ShoppingCart, product_id_id=product_id, user_id_id=user_id)
-
-        shopping_cart_item.count_product = int(count_product)
-        shopping_cart_item.save()
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = self.serializer_class(shopping_cart_item)
+        product_id = serializer.validated_data['product_id']
+        count_product = serializer.validated_data['count_product']
+        try:
+            updated = get_cart_store().set_count(user_id, product_id, count_product)
+        except OutOfStockError as e:
+            return Response({'message': str(e), 'products': e.shortages}, status=status.HTTP_400_BAD_REQUEST)
+        if not updated:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
         return Response(serializer.data)
 
 
@@ -493,45 +816,54 @@ class CreateOrderAPIView(APIView):
 
     def post(self, request):
         try:
-            user_id = request.user.id
+            order = checkout(request.user.id)
+        except MissingShippingAddressError as e:
+            return Response({'message': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except InsufficientStockError as e:
+            return Response({'message': str(e), 'products': e.shortages}, status=status.HTTP_400_BAD_REQUEST)
+        except CheckoutError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            if not ShippingAddress.objects.filter(user_id=user_id).exists():
-                return Response({'message': 'Shipping address not found!'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = OrderDetailSerializer(order)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-            shipping_address = ShippingAddress.objects.get(user_id=user_id)
-            products = ShoppingCart.objects.filter(user_id=user_id)
-            data = []
 
-            if not products.exists():
-                return Response({'message': 'Shopping cart is empty!'}, status=status.HTTP_400_BAD_REQUEST)
+class GetOrderAPIView(EagerLoadingViewMixin, GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = GetOrderSerializer
+    queryset = Order.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-id',)
 
-            for product_cart in products:
-                order = Order.objects.create(
-                    shipping_address=shipping_address,
-                    product=product_cart.product_id,
-                    user_id=user_id,
-                    count_product=product_cart.count_product
-                )
-                serializer = CreateOrderSerializer(order)
-                data.append(serializer.data)
+    @swagger_auto_schema(query_serializer=OrderHistoryQuerySerializer)
+    def get(self, request):
+        """The user's orders, newest first, a page at a time; ``status`` narrows them to one status."""
+        query_serializer = OrderHistoryQuerySerializer(data=request.query_params)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(data, status=status.HTTP_201_CREATED)
-        except Exception as e:
-            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset().filter(user_id=request.user.id)
+        if 'status' in query_serializer.validated_data:
+            queryset = queryset.filter(status=query_serializer.validated_data['status'])
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
-class GetOrderAPIView(RetrieveAPIView):
+class OrderSummaryAPIView(APIView):
     permission_classes = (IsAuthenticated,)
-    serializer_class = GetOrderSerializer
 
+    @swagger_auto_schema(responses={200: OrderSummarySerializer})
     def get(self, request):
-        user_id = request.user.id
-        try:
-            data = Order.objects.filter(user_id=user_id)
-            data_serializer = self.serializer_class(data, many=True)
-            return Response(data=data_serializer.data)
-        except Exception as e:
-            return Response({'message': f'{e}'})
+        return Response(OrderSummarySerializer(order_summary(request.user.id)).data)
+
+
+class OrderDetailAPIView(EagerLoadingViewMixin, RetrieveAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = OrderDetailSerializer
+    queryset = Order.objects.all()
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user_id=self.request.user.id)
 
 
 class UpdateUserOrderAPIView(GenericAPIView):
@@ -539,24 +871,44 @@ class UpdateUserOrderAPIView(GenericAPIView):
     serializer_class = UpdateOrderSerializer
 
     def patch(self, request):
-        user_id = request.user.id
-        product_id = request.data.get('product')
-
-        data = Order.objects.filter(Q(user_id=user_id) and Q(product=product_id))
-        if data:
-            for x in data:
-                x.status = 'completed'
-                x.save()
-            data_serializer = GetOrderSerializer(data, many=True)
-            return Response(data_serializer.data, status=201)
-        else:
+        """Confirm delivery: complete the user's shipped orders containing the product."""
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = Order.objects.filter(user_id=request.user.id, items__product_id=serializer.validated_data['product'])
+        if not orders.exists():
             return Response({'message': 'Order not Found!'}, status=404)
 
+        moved = transition_orders(orders, 'completed')
+        if not moved:
+            return Response({'message': 'Order is not shipped yet!'}, status=status.HTTP_400_BAD_REQUEST)
+        data_serializer = GetOrderSerializer(Order.objects.filter(id__in=moved).order_by('id'), many=True)
+        return Response(data_serializer.data, status=201)
+
+
+class OrderStatusBatchAPIView(GenericAPIView):
+    permission_classes = (IsAuthenticated, AdminPermission)
+    serializer_class = OrderStatusBatchSerializer
+
+    def post(self, request):
+        """
+        Move up to 10 000 orders to ``status`` in bulk. Orders whose current
+        status does not allow the transition are returned as ``skipped``.
+        """
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        order_ids = set(serializer.validated_data['order_ids'])
+        moved = transition_orders(Order.objects.filter(id__in=order_ids), serializer.validated_data['status'])
+        return Response({'updated': len(moved), 'skipped': sorted(order_ids - set(moved))})
+
 
 @receiver(post_save, sender=User)
 def create_user_wallet(sender, instance, created, **kwargs):
     if created:
-        UserWallet.objects.create(user=instance)
+        open_wallet(instance)
 
 
 class PaymentAPIView(GenericAPIView):
@@ -564,18 +916,25 @@ class PaymentAPIView(GenericAPIView):
     serializer_class = PaymentSerializer
 
     def post(self, request):
-        user_id = request.user.id
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        idempotency_key = serializer.validated_data.get('idempotency_key') or request.headers.get('Idempotency-Key')
+        if idempotency_key and len(idempotency_key) > 64:
+            return Response({'message': 'Idempotency key is too long!'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            user_wallet = UserWallet.objects.get(user_id=user_id)
-            products_cash = request.data.get('cash')
-            if user_wallet.cash >= products_cash:
-                user_wallet.cash -= products_cash
-                user_wallet.save()
-                return Response({'message': 'Payment completed!'})
-            else:
-                return Response({'message': 'In Your Wallet not enough money!'})
-        except Exception as e:
-            return Response({'message': f'{e}'})
+            entry, replayed = debit(request.user.id, serializer.validated_data['cash'], idempotency_key)
+        except WalletNotFoundError as e:
+            return Response({'message': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except IdempotencyKeyReusedError as e:
+            return Response({'message': str(e)}, status=status.HTTP_409_CONFLICT)
+        except WalletError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'message': 'Payment completed!',
+            'transaction_id': entry.id,
+            'cash': entry.balance_after,
+            'replayed': replayed,
+        })
 
 
 class GetUserWalletAPIView(APIView):
@@ -694,10 +1053,12 @@ class GetSimilarProductsAPIView(GenericAPIView):
             return Response(e, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ColorGetAPIView(RetrieveAPIView):
+@conditional_catalog('color')
+class ColorGetAPIView(CachedRetrieveMixin, RetrieveAPIView):
     queryset = Color.objects.all()
     permission_classes = ()
     serializer_class = ColorSerializer
+    cache_namespace = 'color'
 
 
 class CreateColorAPIView(CreateAPIView):
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from .models import UserWallet, WalletTransaction
+
+CENT = Decimal('0.01')
+
+
+class WalletError(Exception):
+    pass
+
+
+class WalletNotFoundError(WalletError):
+    def __init__(self):
+        super().__init__('User Wallet not found!')
+
+
+class InsufficientFundsError(WalletError):
+    def __init__(self):
+        super().__init__('In Your Wallet not enough money!')
+
+
+class IdempotencyKeyReusedError(WalletError):
+    def __init__(self):
+        super().__init__('Idempotency key was already used for a different payment!')
+
+
+def open_wallet(user):
+    """Create the user's wallet with its opening balance as the first ledger entry."""
+    with transaction.atomic():
+        wallet = UserWallet.objects.create(user=user)
+        WalletTransaction.objects.create(user=user, kind='opening', amount=wallet.cash, balance_after=wallet.cash)
+    return wallet
+
+
+def _replay(user_id, amount, idempotency_key):
+    entry = WalletTransaction.objects.filter(user_id=user_id, idempotency_key=idempotency_key).first()
+    if entry is not None and entry.amount != -amount:
+        raise IdempotencyKeyReusedError()
+    return entry
+
+
+def debit(user_id, amount, idempotency_key=None):
+    """
+    Take ``amount`` from the user's wallet and return ``(entry, replayed)``,
+    the ledger entry of the payment and whether it was made by an earlier
+    request with the same ``idempotency_key``.
+
+    The balance is checked and lowered by a single conditional ``UPDATE ...
+    SET cash = cash - amount WHERE cash >= amount``, so concurrent payments
+    queue on the wallet row and can never overdraw it. The ledger entry is
+    written in the same transaction; when a concurrent retry with the same
+    key commits first, the unique key makes this insert fail, the debit is
+    rolled back and the retry's entry is returned instead.
+    """
+    amount = Decimal(amount).quantize(CENT)
+    if idempotency_key:
+        entry = _replay(user_id, amount, idempotency_key)
+        if entry is not None:
+            return entry, True
+
+    try:
+        with transaction.atomic():
+            wallet_id = UserWallet.objects.filter(user_id=user_id).order_by('id').values_list('id', flat=True).first()
+            if wallet_id is None:
+                raise WalletNotFoundError()
+            wallet = UserWallet.objects.filter(id=wallet_id)
+            if not wallet.filter(cash__gte=amount).update(cash=F('cash') - amount):
+                raise InsufficientFundsError()
+            balance = wallet.values_list('cash', flat=True).get()
+            entry = WalletTransaction.objects.create(user_id=user_id, kind='debit', amount=-amount,
+                                                     balance_after=balance, idempotency_key=idempotency_key or None)
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        entry = _replay(user_id, amount, idempotency_key)
+        if entry is None:
+            raise
+        return entry, True
+    return entry, False